@@ -0,0 +1,251 @@
+"""Admission control for upstream calls: a concurrency limit, a bounded queue and latency budgets"""
+import heapq
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from cancellation import CancelToken
+
+
+def parse_budgets(text):
+    """{"comedy": 5.0, ...} from "comedy=5,storyteller=10" """
+    budgets = {}
+    for pair in (text or "").split(","):
+        if "=" in pair:
+            style, seconds = pair.split("=", 1)
+            budgets[style.strip()] = float(seconds)
+    return budgets
+
+
+class Overloaded(Exception):
+    """A request shed instead of admitted; ``reason`` is queue_full, over_budget or queue_timeout"""
+
+    def __init__(self, reason):
+        super().__init__(f"upstream overloaded ({reason})")
+        self.reason = reason
+
+
+class Slot:
+    """One admitted upstream call.
+
+    Pass ``cancel`` to the call: it fires when the request's own token does,
+    or when the budget runs out before ``responded()`` (reason "deadline").
+    Always ``release()`` (or use as a context manager).
+    """
+
+    def __init__(self, control, kind, deadline, request_cancel=None):
+        self.control = control
+        self.kind = kind
+        self.deadline = deadline
+        self.cancel = CancelToken()
+        self.granted = time.monotonic()
+        self.responded_after = None
+        self._unlink = request_cancel.on_cancel(lambda: self.cancel.cancel(request_cancel.reason)) \
+            if request_cancel is not None else None
+        self._released = False
+
+    def responded(self):
+        """The first text has arrived: the deadline no longer applies"""
+        if self.responded_after is None:
+            self.responded_after = time.monotonic() - self.granted
+
+    def _expire(self):
+        if self.responded_after is None and not self._released and self.cancel.cancel("deadline"):
+            self.control._count("deadline_expired")
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        if self._unlink:
+            self._unlink()
+        # Cut-off calls count at what they cost so far, a lower bound that still
+        # pushes the estimate up during an incident; other failures say nothing
+        if self.responded_after is not None:
+            self.control._observe(self.kind, self.responded_after)
+        elif self.cancel.reason == "deadline":
+            self.control._observe(self.kind, time.monotonic() - self.granted)
+        self.control._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+
+class AdmissionControl:
+    """At most ``max_concurrent`` upstream calls, with up to ``max_queue`` more waiting.
+
+    Every request gets a latency budget (``budgets`` per voice style, else
+    ``default_budget`` seconds). A request is shed (Overloaded) rather than
+    queued when the queue is full, or when its estimated wait plus the
+    observed upstream latency (``percentile`` of recent calls of its kind)
+    would exceed the budget; and if it's still queued when only that
+    latency's worth of budget is left. Once admitted, the call is cut off
+    (Slot.cancel) if it hasn't responded by the end of the budget.
+
+    Waiters are futures, so threads and asyncio tasks share one queue.
+    """
+
+    def __init__(self, max_concurrent, max_queue=0, budgets=None, default_budget=10.0,
+                 percentile=90, min_samples=10, window=60.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.budgets = budgets or {}
+        self.default_budget = default_budget
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.window = window
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiters = deque()
+        self._latencies = {}
+        self._deadlines = _Deadlines()
+        self.counters = {"admitted": 0, "queued": 0, "queue_full": 0, "over_budget": 0,
+                         "queue_timeout": 0, "deadline_expired": 0}
+
+    def budget(self, voice_style):
+        return self.budgets.get(voice_style, self.default_budget)
+
+    def _count(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+    def _observe(self, kind, seconds):
+        with self._lock:
+            self._latencies.setdefault(kind, deque(maxlen=200)).append((time.monotonic(), seconds))
+
+    def expected(self, kind, percentile=None):
+        """Upstream latency of ``kind`` calls in the last ``window`` seconds at a percentile, or None.
+
+        Old samples age out so that, once shedding stops all calls, requests
+        are let through again to find out whether upstream has recovered.
+        """
+        since = time.monotonic() - self.window
+        with self._lock:
+            samples = sorted(seconds for at, seconds in self._latencies.get(kind, ()) if at >= since)
+        if len(samples) < self.min_samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * (percentile or self.percentile) / 100))
+        return samples[index]
+
+    def _enter(self, voice_style, kind):
+        """(deadline, queued Future or None if admitted at once, seconds it may stay queued)"""
+        budget = self.budget(voice_style)
+        started = time.monotonic()
+        expected = self.expected(kind)
+        median = self.expected(kind, 50)
+        with self._lock:
+            queued = len(self._waiters)
+            free = self._active < self.max_concurrent and not queued
+            if not free and queued >= self.max_queue:
+                self.counters["queue_full"] += 1
+                raise Overloaded("queue_full")
+            if expected is not None:
+                # Each round of max_concurrent calls ahead costs about a median call
+                wait = 0 if free else (queued // self.max_concurrent + 1) * median
+                if wait + expected > budget:
+                    self.counters["over_budget"] += 1
+                    raise Overloaded("over_budget")
+            if free:
+                self._active += 1
+                self.counters["admitted"] += 1
+                return started + budget, None, 0
+            waiter = Future()
+            self._waiters.append(waiter)
+            self.counters["queued"] += 1
+        return started + budget, waiter, max(0.0, budget - (expected or 0))
+
+    def _abandon(self, waiter):
+        """Give up a queued place; False if a slot was granted meanwhile"""
+        with self._lock:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                return False
+            self.counters["queue_timeout"] += 1
+            return True
+
+    def _release(self):
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if waiter.set_running_or_notify_cancel():
+                    self.counters["admitted"] += 1
+                    # The slot passes straight to the waiter
+                    waiter.set_result(None)
+                    return
+            self._active -= 1
+
+    def _slot(self, kind, deadline, cancel):
+        slot = Slot(self, kind, deadline, cancel)
+        self._deadlines.add(deadline, slot)
+        return slot
+
+    def acquire(self, voice_style, kind="generate", cancel=None):
+        """Slot for one upstream call; raises Overloaded if the request should be shed"""
+        deadline, waiter, patience = self._enter(voice_style, kind)
+        if waiter is not None:
+            try:
+                waiter.result(patience)
+            except FutureTimeout:
+                if self._abandon(waiter):
+                    raise Overloaded("queue_timeout")
+        return self._slot(kind, deadline, cancel)
+
+    async def acquire_async(self, voice_style, kind="generate", cancel=None):
+        """acquire() for coroutines: queues without holding a thread"""
+        import asyncio  # only the ASGI app gets here; the WSGI one needn't load it
+        deadline, waiter, patience = self._enter(voice_style, kind)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(waiter)), patience)
+            except asyncio.TimeoutError:
+                if self._abandon(waiter):
+                    raise Overloaded("queue_timeout")
+            except asyncio.CancelledError:
+                if not self._abandon(waiter):
+                    self._release()
+                raise
+        return self._slot(kind, deadline, cancel)
+
+    def stats(self):
+        with self._lock:
+            stats = {"in_flight": self._active, "waiting": len(self._waiters), **self.counters}
+        for kind in sorted(self._latencies):
+            expected = self.expected(kind)
+            stats[f"expected_{kind}_ms"] = round(expected * 1000) if expected is not None else None
+        return stats
+
+
+class _Deadlines:
+    """One thread expiring slots whose budget has run out"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._heap = []
+        self._sequence = 0
+        self._pid = None
+
+    def add(self, when, slot):
+        with self._cond:
+            # Started lazily, once per process, so forked workers get their own
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._heap = []
+                threading.Thread(target=self._run, name="admission-deadlines", daemon=True).start()
+            self._sequence += 1
+            heapq.heappush(self._heap, (when, self._sequence, slot))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                _, _, slot = heapq.heappop(self._heap)
+            slot._expire()
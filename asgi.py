@@ -0,0 +1,505 @@
+"""ASGI entry point: async /v1/chat/completions, every other route via the Flask app.
+
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT
+
+Gemini waits and paced streams are coroutines here rather than worker
+threads, so one process can hold hundreds of them. The chat endpoint reuses
+main.py's planning, caching, session and response-building code, so its
+responses match the Flask endpoint's exactly; other routes (and chat GET /
+OPTIONS) are the Flask app itself, run on a thread pool.
+"""
+import asyncio
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.datastructures import Headers
+
+import main
+from async_gemini import AsyncGeminiClient
+from admission import Overloaded
+from gemini_client import GeminiError, GeminiCancelled
+
+gemini = AsyncGeminiClient(
+    main.GEMINI_API_KEY,
+    main.GEMINI_BASE_URL,
+    pool_size=int(os.environ.get('ASYNC_GEMINI_POOL_SIZE', 100)),
+    max_retries=main.gemini_client.max_retries,
+    connect_timeout=main.gemini_client.timeout[0],
+    read_timeout=main.gemini_client.timeout[1]
+)
+
+# Flask routes and session-store calls (which may block on Redis/SQLite) run here
+wsgi_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('ASGI_THREADS', 32)),
+                                   thread_name_prefix="asgi-sync")
+
+CORS_HEADERS = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                for name, value in main.CORS_HEADERS.items()]
+
+
+async def run_sync(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(wsgi_executor, fn, *args)
+
+
+def cancel_event(cancel):
+    """(asyncio.Event set when ``cancel`` fires, remover)"""
+    event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    return event, cancel.on_cancel(lambda: loop.call_soon_threadsafe(event.set))
+
+
+# Story generation, mirroring main.generate_intelligent_story / stream_intelligent_story
+
+async def call_gemini_async(prompt_text, voice_style, cancel=None, surplus_key=None):
+    """call_gemini_smart on the async client"""
+    if not main.GEMINI_API_KEY:
+        return None
+
+    candidates = main.surplus_candidates(surplus_key)
+    payload = main.build_gemini_payload(prompt_text, voice_style, candidates)
+    started = time.perf_counter()
+    try:
+        data = await gemini.generate(payload, cancel)
+        texts = main.candidate_texts(data)
+        if texts:
+            return main.keep_surplus(surplus_key, texts, candidates, voice_style) if candidates > 1 else texts[0]
+    except GeminiCancelled:
+        if cancel.reason == "deadline":
+            print("Gemini call over its latency budget - falling back")
+            main.metrics.inc("talespin_timeouts_total", source="deadline", voice_style=voice_style)
+        else:
+            main.active_requests.count("upstream_aborted")
+    except GeminiError as e:
+        if isinstance(e.__cause__, asyncio.TimeoutError):
+            print("Gemini API timeout - falling back")
+            main.metrics.inc("talespin_timeouts_total", source="gemini", voice_style=voice_style)
+        else:
+            print(e)
+    except Exception as e:
+        print(f"API call error: {e}")
+    finally:
+        main.metrics.observe("talespin_stage_seconds", time.perf_counter() - started,
+                             stage="upstream", voice_style=voice_style)
+
+    return None
+
+
+async def stream_gemini_async(prompt_text, voice_style, cancel=None):
+    """stream_gemini_smart on the async client"""
+    if not main.GEMINI_API_KEY:
+        return
+
+    payload = main.build_gemini_payload(prompt_text, voice_style)
+    started = time.perf_counter()
+    events = gemini.stream(payload, cancel)
+    try:
+        async for data in events:
+            for candidate in data.get('candidates', [])[:1]:
+                for part in candidate.get('content', {}).get('parts', []):
+                    if part.get('text'):
+                        yield part['text']
+    finally:
+        await events.aclose()
+
+    main.metrics.observe("talespin_stage_seconds", time.perf_counter() - started,
+                         stage="upstream", voice_style=voice_style)
+
+
+async def call_gemini_admitted(prompt_text, voice_style, cancel=None, surplus_key=None):
+    """main.call_gemini_admitted; queues without holding a thread"""
+    if main.admission is None:
+        return await call_gemini_async(prompt_text, voice_style, cancel, surplus_key)
+
+    with await main.admission.acquire_async(voice_style, "generate", cancel) as slot:
+        story = await call_gemini_async(prompt_text, voice_style, slot.cancel, surplus_key)
+        if story:
+            slot.responded()
+        return story
+
+
+async def stream_gemini_admitted(prompt_text, voice_style, cancel=None):
+    """main.stream_gemini_admitted; queues without holding a thread"""
+    if main.admission is None:
+        upstream = stream_gemini_async(prompt_text, voice_style, cancel)
+        try:
+            async for text in upstream:
+                yield text
+        finally:
+            await upstream.aclose()
+        return
+
+    with await main.admission.acquire_async(voice_style, "stream", cancel) as slot:
+        upstream = stream_gemini_async(prompt_text, voice_style, slot.cancel)
+        try:
+            async for text in upstream:
+                slot.responded()
+                yield text
+        except GeminiCancelled:
+            if slot.cancel.reason == "deadline":
+                main.metrics.inc("talespin_timeouts_total", source="deadline", voice_style=voice_style)
+            raise
+        finally:
+            await upstream.aclose()
+
+
+async def generate_story_async(user_input, session_id, cancel, served=None):
+    """(story, voice style); a cancelled request gets a fallback and leaves the session alone"""
+    topic, voice_style, prompt, is_continuation = await run_sync(main.plan_story, user_input, session_id)
+
+    ready = await run_sync(main.take_ready_story, topic, voice_style, is_continuation, session_id, user_input)
+    if ready:
+        topic, story, source = ready
+        main.count_story(source, voice_style, served)
+        await run_sync(main.remember_story, session_id, topic, story, voice_style, is_continuation)
+        return story, voice_style
+
+    # Continuations depend on the session, so only fresh stories are cached
+    story_cache = main.story_cache
+    cache_key = main.story_cache_key(topic, voice_style) if story_cache and not is_continuation else None
+    story = story_cache.get(cache_key) if cache_key else None
+    source = "cache"
+
+    if not story:
+        source = "gemini"
+        try:
+            surplus_key = main.story_cache_key(topic, voice_style) if not is_continuation else None
+            story = await call_gemini_admitted(prompt, voice_style, cancel, surplus_key)
+        except Overloaded as e:
+            main.count_shed(e, voice_style)
+            source = "shed"
+        if story and cache_key:
+            story_cache.add(cache_key, story)
+
+    if not story:
+        source = "shed" if source == "shed" else "fallback"
+        story = main.fallback_story(topic, voice_style, is_continuation)
+
+    if not cancel.cancelled:
+        main.count_story(source, voice_style, served)
+        await run_sync(main.remember_story, session_id, topic, story, voice_style, is_continuation)
+
+    return story, voice_style
+
+
+async def stream_story_async(user_input, session_id, cancel, served=None):
+    """(voice style, async generator of (text, pause) pieces), as stream_intelligent_story"""
+    topic, voice_style, prompt, is_continuation = await run_sync(main.plan_story, user_input, session_id)
+    story_cache = main.story_cache
+    cache_key = main.story_cache_key(topic, voice_style) if story_cache and not is_continuation else None
+
+    async def pieces():
+        ready = await run_sync(main.take_ready_story, topic, voice_style, is_continuation, session_id, user_input)
+        if ready:
+            main.count_story(ready[2], voice_style, served)
+            for piece in main.story_chunks(ready[1], voice_style):
+                yield piece
+            await run_sync(main.remember_story, session_id, ready[0], ready[1], voice_style, is_continuation)
+            return
+
+        cached = story_cache.get(cache_key) if cache_key else None
+        if cached:
+            main.count_story("cache", voice_style, served)
+            for piece in main.story_chunks(cached, voice_style):
+                yield piece
+            await run_sync(main.remember_story, session_id, topic, cached, voice_style)
+            return
+
+        parts = []
+        failed = finished = shed = False
+        chunker = main.delta_chunker()
+        upstream = stream_gemini_admitted(prompt, voice_style, cancel)
+        try:
+            async for text in upstream:
+                if cancel.cancelled:
+                    break
+                parts.append(text)
+                # Gemini's own delivery is the pacing here
+                for chunk in chunker.feed(text) if chunker else (text,):
+                    yield chunk, 0
+            else:
+                finished = True
+        except (GeneratorExit, asyncio.CancelledError):
+            raise
+        except Overloaded as e:
+            main.count_shed(e, voice_style)
+            shed = True
+        except Exception as e:
+            if not cancel.cancelled:
+                print(f"Gemini stream error: {e}")
+                failed = True
+        finally:
+            await upstream.aclose()
+            if not finished and not failed and not shed:
+                main.active_requests.count("upstream_aborted")
+
+        if cancel.cancelled:
+            return
+
+        # The end of Gemini's last phrase
+        for chunk in chunker.flush() if chunker else ():
+            yield chunk, 0
+
+        fallback = main.stream_fallback(parts, failed, topic, voice_style, is_continuation)
+        source = "shed" if shed else "gemini_partial" if parts and fallback else "fallback" if fallback else "gemini"
+        main.count_story(source, voice_style, served)
+        if fallback:
+            parts.append(fallback)
+            for piece in main.story_chunks(fallback, voice_style):
+                yield piece
+        elif cache_key:
+            story_cache.add(cache_key, ''.join(parts).strip())
+
+        await run_sync(main.remember_story, session_id, topic, ''.join(parts).strip(), voice_style, is_continuation)
+
+    return voice_style, pieces()
+
+
+async def replay(pieces):
+    for piece in pieces:
+        yield piece
+
+
+async def sse_frames(pieces, voice_style, cancel, started, served=None):
+    """main.sse_story_stream's frames, with pacing as a non-blocking wait"""
+    stopped, remove = cancel_event(cancel)
+    first = True
+
+    yield main.SSE_START_FRAME
+    try:
+        async for chunk, delay in pieces:
+            if cancel.cancelled:
+                break
+            if first:
+                main.metrics.observe("talespin_stage_seconds", time.perf_counter() - started,
+                                     stage="first_chunk", voice_style=voice_style)
+                first = False
+            yield main.sse_content_frame(chunk, delay)
+
+            if delay and main.STREAM_PACING == "server":
+                try:
+                    await asyncio.wait_for(stopped.wait(), delay)
+                    break
+                except asyncio.TimeoutError:
+                    pass
+    finally:
+        remove()
+        await pieces.aclose()
+        main.metrics.observe("talespin_stage_seconds", time.perf_counter() - started,
+                             stage="stream", voice_style=voice_style)
+
+    for frame in main.sse_end_frames((served or {}).get("by")):
+        yield frame
+
+
+# HTTP plumbing
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+def parse_json(headers, body):
+    """request.get_json(): JSON bodies only, anything else is an error"""
+    content_type = headers.get('Content-Type', '').split(';')[0].strip().lower()
+    if content_type != 'application/json' and not (content_type.startswith('application/') and content_type.endswith('+json')):
+        raise ValueError("Did not attempt to load JSON data because the request Content-Type was not 'application/json'.")
+    return json.loads(body)
+
+
+async def send_json(send, body, status=200):
+    # Compact, as jsonify is outside debug mode
+    raw = (main.app.json.dumps(body, separators=(",", ":")) + "\n").encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status, 'headers': [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(raw)).encode()),
+        *CORS_HEADERS
+    ]})
+    await send({'type': 'http.response.body', 'body': raw})
+
+
+async def watch_disconnect(receive, cancel):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+    if cancel.cancel("disconnected"):
+        main.active_requests.count("disconnected")
+
+
+async def watched(receive, cancel, work):
+    """Await ``work`` while watching for the client hanging up, which cancels it"""
+    watcher = asyncio.ensure_future(watch_disconnect(receive, cancel))
+    try:
+        return await work
+    finally:
+        watcher.cancel()
+
+
+async def send_sse(send, receive, frames, cancel):
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [
+        (b'content-type', b'text/event-stream; charset=utf-8'),
+        *CORS_HEADERS
+    ]})
+    watcher = asyncio.ensure_future(watch_disconnect(receive, cancel))
+    try:
+        async for frame in frames:
+            await send({'type': 'http.response.body', 'body': frame.encode('utf-8'), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        watcher.cancel()
+        await frames.aclose()
+
+
+async def chat_completions(scope, receive, send):
+    """elevenlabs_agent_endpoint (POST), async"""
+    started = time.perf_counter()
+    headers = Headers([(name.decode('latin-1'), value.decode('latin-1')) for name, value in scope['headers']])
+    body = await read_body(receive)
+    streaming = False
+    try:
+        data = parse_json(headers, body) or {}
+        # May read and move session state, which can mean a database round trip
+        user_message, session_id, derived = await run_sync(main.read_chat_request, data, headers)
+        is_interruption, cancel = main.begin_chat_request(user_message, session_id, derived)
+        served = {}
+        try:
+            # Handle streaming if requested
+            if data.get('stream', False):
+                if main.GEMINI_STREAMING:
+                    detected_style, pieces = await stream_story_async(user_message, session_id, cancel, served)
+                else:
+                    story, detected_style = await watched(
+                        receive, cancel, generate_story_async(user_message, session_id, cancel, served))
+                    pieces = replay(main.story_chunks(story, detected_style))
+
+                streaming = True
+                await send_sse(send, receive, sse_frames(pieces, detected_style, cancel, started, served), cancel)
+                return
+
+            story, detected_style = await watched(
+                receive, cancel, generate_story_async(user_message, session_id, cancel, served))
+            main.metrics.observe("talespin_stage_seconds", time.perf_counter() - started,
+                                 stage="total", voice_style=detected_style)
+        finally:
+            main.active_requests.end(session_id, cancel)
+
+        await send_json(send, main.chat_completion_body(user_message, story, detected_style, session_id,
+                                                     is_interruption, served.get("by")))
+
+    except Exception as e:
+        print(f"Endpoint error: {e}")
+        # Once a stream has started there's no replacing it with an error body
+        if not streaming:
+            await send_json(send, main.ENDPOINT_ERROR_BODY)
+
+
+def wsgi_environ(scope, body):
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+async def call_flask(scope, receive, send):
+    """Run the request through the Flask app on a thread, streaming its response back"""
+    environ = wsgi_environ(scope, await read_body(receive))
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def put(item):
+        loop.call_soon_threadsafe(queue.put_nowait, item)
+
+    def run():
+        try:
+            def start_response(status, response_headers, exc_info=None):
+                put(('start', int(status.split()[0]), response_headers))
+                return lambda data: put(('body', data))
+
+            result = main.app(environ, start_response)
+            try:
+                for chunk in result:
+                    if chunk:
+                        put(('body', chunk))
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        except Exception as e:
+            put(('error', e))
+        finally:
+            put(('end', None))
+
+    loop.run_in_executor(wsgi_executor, run)
+    started = False
+    while True:
+        kind, *value = await queue.get()
+        if kind == 'start':
+            status, response_headers = value
+            await send({'type': 'http.response.start', 'status': status, 'headers': [
+                (name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in response_headers]})
+            started = True
+        elif kind == 'body':
+            await send({'type': 'http.response.body', 'body': value[0], 'more_body': True})
+        elif kind == 'error':
+            print(f"WSGI app error: {value[0]}")
+        else:
+            if started:
+                await send({'type': 'http.response.body', 'body': b''})
+            else:
+                await send({'type': 'http.response.start', 'status': 500, 'headers': []})
+                await send({'type': 'http.response.body', 'body': b''})
+            return
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            if main.WARMUP:
+                await run_sync(main.warm_up, False)
+                if main.GEMINI_API_KEY and await gemini.warm_up():
+                    print("Gemini connection open")
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await gemini.close()
+            wsgi_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    elif scope['type'] == 'http':
+        if scope['method'] == 'POST' and scope['path'] == '/v1/chat/completions':
+            await chat_completions(scope, receive, send)
+        else:
+            await call_flask(scope, receive, send)
@@ -0,0 +1,310 @@
+"""Asyncio Gemini client for the ASGI app.
+
+Speaks just enough HTTP/1.1 over asyncio streams (keep-alive, Content-Length
+and chunked bodies) for generateContent and streamGenerateContent, so an
+upstream wait costs a coroutine instead of a thread. Retries and errors
+behave like GeminiClient's.
+"""
+import asyncio
+import json
+import random
+import ssl
+from urllib.parse import urlsplit
+
+from gemini_client import GeminiError, GeminiCancelled, RETRYABLE_STATUS
+
+
+class _Abort:
+    """Closes a call's current connection when its CancelToken fires (from any thread)"""
+
+    def __init__(self, cancel):
+        self.cancel = cancel
+        self.writer = None
+        self.event = asyncio.Event()
+        self._remove = None
+        if cancel is not None:
+            loop = asyncio.get_running_loop()
+            self._remove = cancel.on_cancel(lambda: loop.call_soon_threadsafe(self._fire))
+
+    def _fire(self):
+        self.event.set()
+        if self.writer is not None:
+            self.writer.close()
+
+    @property
+    def fired(self):
+        return self.cancel is not None and self.cancel.cancelled
+
+    def check(self, cause=None):
+        if self.fired:
+            raise GeminiCancelled("Gemini request cancelled") from cause
+
+    def done(self):
+        if self._remove:
+            self._remove()
+
+
+class AsyncGeminiClient:
+    """Keep-alive connection pool plus bounded retries, for use on one event loop.
+
+    Like GeminiClient, calls take an optional CancelToken; cancelling it closes
+    the call's connection, so Gemini stops generating and the call raises
+    GeminiCancelled at once. Closing a stream early does the same.
+    """
+
+    def __init__(self, api_key, base_url, pool_size=100, max_retries=2,
+                 backoff=0.25, max_backoff=4.0, connect_timeout=5, read_timeout=30):
+        parts = urlsplit(base_url.rstrip('/'))
+        self.api_key = api_key
+        self.host = parts.hostname
+        self.tls = parts.scheme == 'https'
+        self.port = parts.port or (443 if self.tls else 80)
+        self.path = parts.path
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+        self._ssl = ssl.create_default_context() if self.tls else None
+        self._idle = []
+        self.stats = {"requests": 0, "retries": 0, "failures": 0, "connections": 0}
+
+    # Connections
+
+    async def _connect(self):
+        self.stats["connections"] += 1
+        return await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=self._ssl,
+                                    server_hostname=self.host if self.tls else None),
+            self.connect_timeout)
+
+    async def _acquire(self):
+        """(reader, writer, reused)"""
+        while self._idle:
+            reader, writer = self._idle.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return reader, writer, True
+            writer.close()
+        reader, writer = await self._connect()
+        return reader, writer, False
+
+    def _release(self, reader, writer):
+        if len(self._idle) < self.pool_size and not writer.is_closing():
+            self._idle.append((reader, writer))
+        else:
+            writer.close()
+
+    async def warm_up(self):
+        """Open a pooled connection before the first call; True if Gemini answered.
+
+        Like GeminiClient.warm_up, a GET on the model (its metadata) costs no
+        tokens but sees the connection through TLS and a first exchange.
+        """
+        try:
+            reader, writer = await self._connect()
+            writer.write((f"GET {self.path} HTTP/1.1\r\n"
+                          f"Host: {self.host}\r\n"
+                          f"x-goog-api-key: {self.api_key}\r\n"
+                          "Connection: keep-alive\r\n\r\n").encode('latin-1'))
+            await writer.drain()
+            _, headers = await self._read_head(reader)
+            async for _ in self._body(reader, headers):
+                pass
+        except (OSError, EOFError, asyncio.TimeoutError):
+            return False
+        if self._reusable(headers):
+            self._release(reader, writer)
+        else:
+            writer.close()
+        return True
+
+    async def close(self):
+        while self._idle:
+            self._idle.pop()[1].close()
+
+    # HTTP/1.1
+
+    async def _send(self, writer, method, payload, stream):
+        query = "?alt=sse" if stream else ""
+        body = json.dumps(payload).encode('utf-8')
+        # The key goes in a header: a URL ends up in error messages and logs
+        head = (f"POST {self.path}:{method}{query} HTTP/1.1\r\n"
+                f"Host: {self.host}\r\n"
+                f"x-goog-api-key: {self.api_key}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: keep-alive\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    async def _readline(self, reader):
+        line = await asyncio.wait_for(reader.readline(), self.read_timeout)
+        if not line:
+            raise asyncio.IncompleteReadError(b'', None)
+        return line
+
+    async def _read_head(self, reader):
+        status_line = await self._readline(reader)
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self._readline(reader)
+            if line in (b'\r\n', b'\n'):
+                return status, headers
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+    async def _body(self, reader, headers):
+        """Yield the body's bytes as they arrive"""
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            while True:
+                size = int((await self._readline(reader)).split(b';')[0], 16)
+                if size == 0:
+                    # Trailers, then the blank line ending the body
+                    while (await self._readline(reader)) not in (b'\r\n', b'\n'):
+                        pass
+                    return
+                yield await asyncio.wait_for(reader.readexactly(size), self.read_timeout)
+                await asyncio.wait_for(reader.readexactly(2), self.read_timeout)
+        elif 'content-length' in headers:
+            remaining = int(headers['content-length'])
+            while remaining:
+                data = await asyncio.wait_for(reader.read(min(remaining, 65536)), self.read_timeout)
+                if not data:
+                    raise asyncio.IncompleteReadError(b'', remaining)
+                remaining -= len(data)
+                yield data
+        else:
+            while True:
+                data = await asyncio.wait_for(reader.read(65536), self.read_timeout)
+                if not data:
+                    return
+                yield data
+
+    def _reusable(self, headers):
+        return headers.get('connection', '').lower() != 'close' and (
+            'content-length' in headers or 'chunked' in headers.get('transfer-encoding', '').lower())
+
+    async def _sleep_before_retry(self, abort, attempt, headers=None):
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+        try:
+            delay = max(delay, min(self.max_backoff, float((headers or {}).get('retry-after', 0))))
+        except ValueError:
+            pass
+        try:
+            await asyncio.wait_for(abort.event.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+        abort.check()
+
+    async def _exchange(self, method, payload, stream, abort):
+        """Send once, retrying straight away if a pooled connection turns out stale"""
+        reader, writer, reused = await self._acquire()
+        abort.writer = writer
+        try:
+            await self._send(writer, method, payload, stream)
+            status, headers = await self._read_head(reader)
+        except (ConnectionError, EOFError) as e:
+            writer.close()
+            # A cancelled call's connection was closed on purpose: not stale
+            abort.check(e)
+            if not reused:
+                raise
+            reader, writer = await self._connect()
+            abort.writer = writer
+            try:
+                await self._send(writer, method, payload, stream)
+                status, headers = await self._read_head(reader)
+            except BaseException:
+                writer.close()
+                raise
+        except BaseException:
+            writer.close()
+            raise
+        return reader, writer, status, headers
+
+    async def _post(self, method, payload, abort, stream=False):
+        """(reader, writer, headers) of a 200 response, after bounded retries; raises GeminiError"""
+        for attempt in range(self.max_retries + 1):
+            last_try = attempt == self.max_retries
+            abort.check()
+            self.stats["requests"] += 1
+            try:
+                reader, writer, status, headers = await self._exchange(method, payload, stream, abort)
+            except (OSError, EOFError, asyncio.TimeoutError) as e:
+                abort.check(e)
+                if last_try:
+                    self.stats["failures"] += 1
+                    raise GeminiError(f"Gemini request failed: {e!r}") from e
+                self.stats["retries"] += 1
+                await self._sleep_before_retry(abort, attempt)
+                continue
+
+            if status == 200:
+                return reader, writer, headers
+
+            # Error bodies are small: read them so the connection can be reused
+            try:
+                async for _ in self._body(reader, headers):
+                    pass
+                self._release(reader, writer) if self._reusable(headers) else writer.close()
+            except (OSError, EOFError, asyncio.TimeoutError):
+                writer.close()
+            if status not in RETRYABLE_STATUS or last_try:
+                self.stats["failures"] += 1
+                raise GeminiError(f"Gemini API error: {status}", status=status)
+            self.stats["retries"] += 1
+            await self._sleep_before_retry(abort, attempt, headers)
+
+    async def generate(self, payload, cancel=None):
+        """generateContent call; returns the decoded JSON body"""
+        abort = _Abort(cancel)
+        try:
+            reader, writer, headers = await self._post("generateContent", payload, abort)
+            try:
+                body = b''.join([data async for data in self._body(reader, headers)])
+            except (OSError, EOFError, asyncio.TimeoutError) as e:
+                writer.close()
+                abort.check(e)
+                raise GeminiError(f"Gemini response failed: {e!r}") from e
+            except BaseException:
+                writer.close()
+                raise
+            self._release(reader, writer) if self._reusable(headers) else writer.close()
+            return json.loads(body)
+        finally:
+            abort.done()
+
+    async def stream(self, payload, cancel=None):
+        """streamGenerateContent call; yields each decoded SSE event.
+
+        Retries only cover getting the stream started, never a half-read one.
+        """
+        abort = _Abort(cancel)
+        try:
+            reader, writer, headers = await self._post("streamGenerateContent", payload, abort, stream=True)
+            complete = False
+            buffer = b''
+            body = self._body(reader, headers)
+            try:
+                async for data in body:
+                    buffer += data
+                    while b'\n' in buffer:
+                        line, buffer = buffer.split(b'\n', 1)
+                        if line.startswith(b'data:'):
+                            yield json.loads(line[5:].decode('utf-8'))
+                complete = True
+            except (OSError, EOFError, asyncio.TimeoutError) as e:
+                abort.check(e)
+                raise GeminiError(f"Gemini stream failed: {e!r}") from e
+            finally:
+                await body.aclose()
+                if complete and self._reusable(headers):
+                    self._release(reader, writer)
+                else:
+                    # Also how an abandoned stream stops Gemini generating
+                    writer.close()
+        finally:
+            abort.done()
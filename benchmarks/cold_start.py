@@ -0,0 +1,190 @@
+"""Cold start: import time, and process start to the first served chat completion.
+
+Import: runs `python -X importtime -c "import main"` (and asgi) in fresh
+processes and reports the median time and the heaviest direct imports, and
+checks that the dependencies loaded lazily stay out of the import.
+
+Startup: for each server (gunicorn, gunicorn with preload, uvicorn), with
+and without WARMUP, starts it against the fake Gemini, whose new connections
+cost --connect-delay seconds like a TLS handshake, and measures:
+  start_to_first_ms: process spawn until a POST /v1/chat/completions,
+                     retried from the start, is answered by Gemini
+  first_request_ms:  the first chat request once /health answers
+  second_request_ms: the request after that
+
+Exits non-zero if the median import of main exceeds --import-budget-ms or a
+lazy dependency is imported eagerly, so it can gate releases:
+
+    python benchmarks/cold_start.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_gemini import FakeGemini, serve  # noqa: E402
+from load_test import free_port  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imported on first use, never by importing the app (asgi needs asyncio itself)
+LAZY_MODULES = {"main": ["requests", "asyncio"], "asgi": ["requests"]}
+
+SERVERS = {
+    "gunicorn": ["gunicorn", {"GUNICORN_PRELOAD": "0"}],
+    "gunicorn_preload": ["gunicorn", {"GUNICORN_PRELOAD": "1"}],
+    "uvicorn": ["uvicorn", {}],
+}
+
+
+def import_profile(module, env):
+    """(total ms, {direct import: cumulative ms}, lazy modules that got imported) for a fresh import"""
+    code = f"import sys, json; import {module}; print(json.dumps([m for m in {LAZY_MODULES[module]!r} if m in sys.modules]))"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    total, children = None, {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = len(name) - len(name.lstrip())
+        if depth == 1 and name.strip() == module:
+            total = int(cumulative) / 1000
+        elif depth == 3:
+            children[name.strip()] = int(cumulative) / 1000
+        elif depth == 1:
+            # A top-level import before ours (site, .pth files): not ours to count
+            children = {}
+    return total, children, json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure_imports(module, runs, env):
+    totals, heaviest, eager = [], {}, set()
+    for _ in range(runs):
+        total, children, lazy = import_profile(module, env)
+        totals.append(total)
+        eager.update(lazy)
+        for name, ms in children.items():
+            heaviest.setdefault(name, []).append(ms)
+    top = sorted(heaviest.items(), key=lambda item: -statistics.median(item[1]))[:8]
+    return {"median_ms": round(statistics.median(totals), 1), "min_ms": round(min(totals), 1),
+            "heaviest_ms": {name: round(statistics.median(ms), 1) for name, ms in top},
+            "eager_lazy_modules": sorted(eager)}
+
+
+def start_server(kind, port, env):
+    if kind == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-b", f"127.0.0.1:{port}",
+                   "--log-level", "warning", "main:app"]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "--host", "127.0.0.1", "--port", str(port),
+                   "--log-level", "warning", "asgi:app"]
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def chat(session, base_url, timeout=30):
+    """Seconds for one non-streaming chat completion; raises unless Gemini wrote it"""
+    body = {"messages": [{"role": "user", "content": "Tell me a story about a lighthouse cat"}], "stream": False}
+    started = time.perf_counter()
+    response = session.post(f"{base_url}/v1/chat/completions", json=body, timeout=timeout)
+    response.raise_for_status()
+    if response.json().get("served_by") != "gemini":
+        raise RuntimeError(f"served by {response.json().get('served_by')}")
+    return time.perf_counter() - started
+
+
+def poll(process, attempt, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with status {process.returncode}")
+        try:
+            return attempt()
+        except requests.ConnectionError:
+            time.sleep(0.005)
+    raise RuntimeError("server did not answer")
+
+
+def startup_run(kind, env):
+    """(start_to_first, first_request, second_request) seconds, from two fresh servers"""
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    session = requests.Session()
+    started = time.perf_counter()
+    process = start_server(kind, port, env)
+    try:
+        poll(process, lambda: chat(session, base_url))
+        start_to_first = time.perf_counter() - started
+    finally:
+        process.terminate()
+        process.wait()
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    session = requests.Session()
+    process = start_server(kind, port, env)
+    try:
+        poll(process, lambda: session.get(f"{base_url}/health", timeout=5).raise_for_status())
+        first = chat(session, base_url)
+        second = chat(session, base_url)
+    finally:
+        process.terminate()
+        process.wait()
+    return start_to_first, first, second
+
+
+def median_ms(values):
+    return round(statistics.median(values) * 1000, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3, help="repetitions per measurement")
+    parser.add_argument("--import-budget-ms", type=float, default=250,
+                        help="fail if importing main takes longer (median)")
+    parser.add_argument("--connect-delay", type=float, default=0.1,
+                        help="seconds the fake Gemini takes to set up each new connection")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake Gemini response latency")
+    parser.add_argument("--servers", default=",".join(SERVERS), help="comma-separated: " + ", ".join(SERVERS))
+    parser.add_argument("--skip-startup", action="store_true", help="measure imports only")
+    args = parser.parse_args()
+
+    fake = FakeGemini(latency=args.latency, connect_delay=args.connect_delay)
+    fake_port = free_port()
+    serve(fake, port=fake_port)
+    env = dict(os.environ, GEMINI_API_KEY="fake", METRICS_DIR="off", GEMINI_STREAMING="0",
+               GEMINI_BASE_URL=f"http://127.0.0.1:{fake_port}/v1beta/models/gemini-2.0-flash")
+
+    results = {"imports": {module: measure_imports(module, args.runs, env) for module in ("main", "asgi")}}
+    failed = results["imports"]["main"]["median_ms"] > args.import_budget_ms or \
+        any(result["eager_lazy_modules"] for result in results["imports"].values())
+    results["import_budget_ms"] = args.import_budget_ms
+
+    if not args.skip_startup:
+        startup = {}
+        for name in args.servers.split(","):
+            kind, overrides = SERVERS[name]
+            for warmup in ("0", "1"):
+                runs = [startup_run(kind, dict(env, WARMUP=warmup, **overrides)) for _ in range(args.runs)]
+                startup[f"{name}{'_warmup' if warmup == '1' else ''}"] = {
+                    "start_to_first_ms": median_ms([run[0] for run in runs]),
+                    "first_request_ms": median_ms([run[1] for run in runs]),
+                    "second_request_ms": median_ms([run[2] for run in runs]),
+                }
+        results["startup"] = startup
+        results["fake_gemini"] = {"connect_delay_ms": args.connect_delay * 1000, "latency_ms": args.latency * 1000}
+
+    print(json.dumps(results, indent=2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
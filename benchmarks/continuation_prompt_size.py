@@ -0,0 +1,67 @@
+"""Continuation prompt size over a long session, with story memory vs the whole story.
+
+Feeds synthetic story parts through the same memory update main.py does and
+prints the estimated prompt tokens per turn; exits non-zero if the memory
+prompt ever grows past the budget plus the fixed template:
+
+    python benchmarks/continuation_prompt_size.py --turns 50
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('GEMINI_API_KEY', '')
+from main import STORY_MEMORY_BUDGET, build_continuation_prompt  # noqa: E402
+from story_memory import estimate_tokens, update_memory  # noqa: E402
+
+NAMES = ["Captain Mira", "Old Tobias", "Pip", "the Lantern Queen", "Professor Vale", "Juniper"]
+PLACES = ["Harbor Town", "the Glass Forest", "Moonwell", "the Clockwork Bridge", "Saltmarsh"]
+VERBS = ["discovered", "chased", "followed", "lost", "mended", "whispered to", "argued with"]
+THINGS = ["a silver key", "the humming map", "a jar of starlight", "the broken compass", "a secret door"]
+
+
+def story_part(rng, turn):
+    sentences = []
+    for _ in range(rng.randint(8, 12)):
+        sentences.append(
+            f"{rng.choice(NAMES).capitalize()} {rng.choice(VERBS)} {rng.choice(THINGS)} "
+            f"near {rng.choice(PLACES)} as the {rng.choice(['wind', 'tide', 'night', 'rain'])} "
+            f"{rng.choice(['rose', 'fell', 'turned', 'settled'])} on day {turn}."
+        )
+    return " ".join(sentences)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    template = estimate_tokens(build_continuation_prompt("", "What happens next?", None))
+    memory, whole, sizes, naive = None, [], [], []
+    for turn in range(1, args.turns + 1):
+        part = story_part(rng, turn)
+        memory = update_memory(memory, part, "a harbor adventure")
+        whole.append(part)
+        sizes.append(estimate_tokens(build_continuation_prompt(part, "What happens next?", memory)))
+        naive.append(template + estimate_tokens(" ".join(whole)))
+
+    limit = template + STORY_MEMORY_BUDGET
+    print(json.dumps({
+        "turns": args.turns,
+        "budget_tokens": STORY_MEMORY_BUDGET,
+        "memory_prompt_tokens": {"turn_1": sizes[0], "turn_10": sizes[min(9, len(sizes) - 1)],
+                                 "last": sizes[-1], "max": max(sizes)},
+        "whole_story_prompt_tokens_last": naive[-1],
+        "stored_memory_bytes": len(json.dumps(memory)),
+        "within_budget": max(sizes) <= limit,
+    }, indent=2))
+    sys.exit(0 if max(sizes) <= limit else 1)
+
+
+if __name__ == "__main__":
+    main()
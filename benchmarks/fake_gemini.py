@@ -0,0 +1,220 @@
+"""Local stand-in for the Gemini generateContent / streamGenerateContent API.
+
+Run it and point the service at it:
+
+    python benchmarks/fake_gemini.py --port 8765 --latency 0.8 --error-rate 0.05
+    GEMINI_API_KEY=fake GEMINI_BASE_URL=http://127.0.0.1:8765/v1beta/models/gemini-2.0-flash python main.py
+
+GET /stats reports how many requests and TCP connections the server has seen,
+which is how connection reuse shows up.
+"""
+import argparse
+import json
+import random
+import socket
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+STORY_SENTENCES = [
+    "Once, in a town where the lamps hummed at dusk, a girl named Wren found a door that was not there yesterday.",
+    "It was painted the colour of late summer, and it was warm to the touch.",
+    "She pressed her ear against it and heard, very faintly, the sound of someone laughing.",
+    "Wren had been told a hundred times not to open strange doors.",
+    "She opened it anyway.",
+    "Behind it was a staircase that wound down into the smell of rain and cinnamon.",
+    "At the bottom sat an old fox in a velvet coat, polishing a brass key.",
+    "\"You're late,\" said the fox, without looking up.",
+    "\"Late for what?\" asked Wren.",
+    "\"For the rest of your story,\" he said, and held out the key.",
+]
+
+
+class FakeGemini:
+    """Behaviour knobs and counters shared by all handler threads"""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503,
+                 stream_delay=0.02, words=250, seed=None, first_chunk_delay=0.0,
+                 chunk_words=6, connect_delay=0.0, retry_after=None, delays=()):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stream_delay = stream_delay
+        self.first_chunk_delay = first_chunk_delay
+        self.chunk_words = chunk_words
+        self.connect_delay = connect_delay
+        # Sent as Retry-After with errors
+        self.retry_after = retry_after
+        # Latencies for the next requests, in order, before ``latency`` applies again
+        self.delays = list(delays)
+        self.words = words
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "stream_requests": 0, "errors": 0, "connections": 0,
+                      "streams_aborted": 0, "requests_aborted": 0, "unauthenticated": 0}
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def delay(self):
+        with self.lock:
+            if self.delays:
+                return self.delays.pop(0)
+            return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    def should_fail(self):
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def story(self, variant=0):
+        words = []
+        sentences = STORY_SENTENCES[variant % len(STORY_SENTENCES):] + STORY_SENTENCES
+        while len(words) < self.words:
+            for sentence in sentences:
+                words.extend(sentence.split())
+        return " ".join(words[:self.words]).rstrip(",") + "."
+
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            # Headers and body go out in separate writes; don't let Nagle delay the body
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            fake.count("connections")
+            # What a new connection costs before its first request (DNS, TLS)
+            time.sleep(fake.connect_delay)
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status, body, headers=None):
+            raw = json.dumps(body).encode()
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def do_GET(self):
+            if self.path.startswith("/stats"):
+                with fake.lock:
+                    self.send_json(200, dict(fake.stats))
+            elif self.path.startswith("/v1beta/models/"):
+                # Model metadata, which the service's warm-up fetches
+                self.send_json(200, {"name": self.path.split("?")[0][len("/v1beta/"):]})
+            else:
+                self.send_json(404, {"error": {"code": 404}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            streaming = ":streamGenerateContent" in self.path
+            fake.count("stream_requests" if streaming else "requests")
+            # Like Gemini, want the key in the x-goog-api-key header (the service never puts it in URLs)
+            if not self.headers.get("x-goog-api-key") or "key=" in self.path:
+                fake.count("unauthenticated")
+                self.send_json(403, {"error": {"code": 403}})
+                return
+            # alt=sse belongs to streamGenerateContent only
+            if not streaming and "alt=sse" in self.path:
+                self.send_json(400, {"error": {"code": 400}})
+                return
+
+            time.sleep(fake.delay())
+            if fake.should_fail():
+                fake.count("errors")
+                retry_after = {"Retry-After": str(fake.retry_after)} if fake.retry_after is not None else None
+                self.send_json(fake.error_status, {"error": {"code": fake.error_status}}, retry_after)
+                return
+
+            if streaming:
+                self.stream_story()
+                return
+
+            count = body.get("generationConfig", {}).get("candidateCount", 1)
+            try:
+                self.send_json(200, {"candidates": [
+                    {"content": {"parts": [{"text": fake.story(i)}], "role": "model"},
+                     "finishReason": "STOP", "index": i}
+                    for i in range(count)
+                ]})
+            except (BrokenPipeError, ConnectionResetError):
+                # The client gave up waiting (a timed-out or cancelled call)
+                fake.count("requests_aborted")
+                self.close_connection = True
+
+        def stream_story(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            words = fake.story().split()
+            step = fake.chunk_words
+            try:
+                # Headers go out at once; the model takes a while to produce its first tokens
+                time.sleep(fake.first_chunk_delay)
+                for i in range(0, len(words), step):
+                    event = {"candidates": [{"content": {"parts": [{"text": " ".join(words[i:i + step]) + " "}],
+                                                         "role": "model"}}]}
+                    data = f"data: {json.dumps(event)}\r\n\r\n".encode()
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                    self.wfile.flush()
+                    time.sleep(fake.stream_delay)
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # The client hung up mid-stream (a cancelled generation)
+                fake.count("streams_aborted")
+                self.close_connection = True
+
+    return Handler
+
+
+def serve(fake, host="127.0.0.1", port=8765):
+    """Start the fake server on a daemon thread; returns the server"""
+    server = ThreadingHTTPServer((host, port), make_handler(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before responding")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds added to latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--retry-after", type=float, help="Retry-After seconds sent with errors")
+    parser.add_argument("--stream-delay", type=float, default=0.02, help="seconds between streamed chunks")
+    parser.add_argument("--words", type=int, default=250, help="story length in words")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--first-chunk-delay", type=float, default=0.0,
+                        help="seconds between a stream's headers and its first chunk")
+    parser.add_argument("--chunk-words", type=int, default=6, help="words per streamed chunk")
+    parser.add_argument("--connect-delay", type=float, default=0.0,
+                        help="seconds each new connection waits before its first request (TLS setup)")
+    args = parser.parse_args()
+
+    fake = FakeGemini(args.latency, args.jitter, args.error_rate, args.error_status,
+                      args.stream_delay, args.words, args.seed, args.first_chunk_delay,
+                      args.chunk_words, args.connect_delay, args.retry_after)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(fake))
+    server.daemon_threads = True
+    print(f"Fake Gemini listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
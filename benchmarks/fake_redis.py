@@ -0,0 +1,179 @@
+"""Tiny in-memory Redis stand-in for trying the redis:// session store locally.
+
+Implements only what session_store.RedisSessionStore uses: strings with EX,
+sorted sets, and WATCH/MULTI/EXEC optimistic transactions.
+
+    python benchmarks/fake_redis.py --port 6399
+    SESSION_STORE_URL=redis://127.0.0.1:6399/0 gunicorn -w 4 -b :8080 main:app
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+
+class FakeRedis:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.strings = {}   # key -> (value, expires_at or None)
+        self.zsets = {}     # key -> {member: score}
+        self.versions = {}  # key -> write counter, for WATCH
+
+    def touch(self, key):
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def get_string(self, key):
+        value = self.strings.get(key)
+        if value and value[1] is not None and value[1] <= time.time():
+            del self.strings[key]
+            self.touch(key)
+            return None
+        return value[0] if value else None
+
+    def run(self, args):
+        """Execute one command under the lock; returns a Python reply value"""
+        name = args[0].upper()
+        key = args[1] if len(args) > 1 else None
+        if name == b'PING':
+            return 'PONG'
+        if name in (b'SELECT', b'AUTH'):
+            return 'OK'
+        if name == b'GET':
+            return self.get_string(key)
+        if name == b'SET':
+            expires = None
+            if len(args) >= 5 and args[3].upper() == b'EX':
+                expires = time.time() + int(args[4])
+            self.strings[key] = (args[2], expires)
+            self.touch(key)
+            return 'OK'
+        if name == b'DEL':
+            removed = 0
+            for k in args[1:]:
+                removed += int(self.strings.pop(k, None) is not None or self.zsets.pop(k, None) is not None)
+                self.touch(k)
+            return removed
+        if name == b'ZADD':
+            zset = self.zsets.setdefault(key, {})
+            added = 0
+            for i in range(2, len(args), 2):
+                added += int(args[i + 1] not in zset)
+                zset[args[i + 1]] = float(args[i])
+            self.touch(key)
+            return added
+        if name == b'ZREM':
+            zset = self.zsets.get(key, {})
+            removed = sum(int(zset.pop(m, None) is not None) for m in args[2:])
+            self.touch(key)
+            return removed
+        if name == b'ZCARD':
+            return len(self.zsets.get(key, {}))
+        if name == b'ZRANGEBYSCORE':
+            def bound(raw, default):
+                raw = raw.decode()
+                if raw in ('-inf', '+inf', 'inf'):
+                    return default, False
+                if raw.startswith('('):
+                    return float(raw[1:]), True
+                return float(raw), False
+            low, low_open = bound(args[2], float('-inf'))
+            high, high_open = bound(args[3], float('inf'))
+            members = sorted(self.zsets.get(key, {}).items(), key=lambda item: item[1])
+            return [m for m, score in members
+                    if (score > low if low_open else score >= low)
+                    and (score < high if high_open else score <= high)]
+        raise ValueError(f"unsupported command {name.decode()}")
+
+
+def encode(reply):
+    if isinstance(reply, Exception):
+        return b'-ERR %s\r\n' % str(reply).encode()
+    if reply is None:
+        return b'$-1\r\n'
+    if isinstance(reply, str):
+        return b'+%s\r\n' % reply.encode()
+    if isinstance(reply, int):
+        return b':%d\r\n' % reply
+    if isinstance(reply, bytes):
+        return b'$%d\r\n%s\r\n' % (len(reply), reply)
+    return b'*%d\r\n' % len(reply) + b''.join(encode(item) for item in reply)
+
+
+def make_handler(redis):
+    class Handler(socketserver.StreamRequestHandler):
+        def read_command(self):
+            line = self.rfile.readline()
+            if not line:
+                return None
+            args = []
+            for _ in range(int(line[1:-2])):
+                length = int(self.rfile.readline()[1:-2])
+                args.append(self.rfile.read(length + 2)[:-2])
+            return args
+
+        def handle(self):
+            watched, queued = None, None
+            while True:
+                args = self.read_command()
+                if args is None:
+                    return
+                name = args[0].upper()
+                with redis.lock:
+                    if name == b'WATCH':
+                        watched = {k: redis.versions.get(k, 0) for k in args[1:]}
+                        reply = 'OK'
+                    elif name == b'UNWATCH':
+                        watched, reply = None, 'OK'
+                    elif name == b'MULTI':
+                        queued, reply = [], 'OK'
+                    elif name == b'DISCARD':
+                        queued, watched, reply = None, None, 'OK'
+                    elif name == b'EXEC':
+                        if watched and any(redis.versions.get(k, 0) != v for k, v in watched.items()):
+                            reply = None
+                        else:
+                            reply = []
+                            for command in queued or []:
+                                try:
+                                    reply.append(redis.run(command))
+                                except Exception as e:
+                                    reply.append(e)
+                        queued, watched = None, None
+                    elif queued is not None:
+                        queued.append(args)
+                        reply = 'QUEUED'
+                    else:
+                        try:
+                            reply = redis.run(args)
+                        except Exception as e:
+                            reply = e
+                self.wfile.write(encode(reply))
+
+    return Handler
+
+
+def serve(host="127.0.0.1", port=6399):
+    """Start the fake server on a daemon thread; returns the server"""
+    server = socketserver.ThreadingTCPServer((host, port), make_handler(FakeRedis()))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6399)
+    args = parser.parse_args()
+
+    server = socketserver.ThreadingTCPServer((args.host, args.port), make_handler(FakeRedis()))
+    server.daemon_threads = True
+    print(f"Fake Redis listening on {args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Compare bare requests.post against the pooled/retrying/hedged GeminiClient.
+
+Everything runs against an in-process fake Gemini server, so no API key is needed:
+
+    python benchmarks/gemini_client_bench.py --calls 200 --error-rate 0.05 --jitter 0.05
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_gemini import FakeGemini, serve  # noqa: E402
+from gemini_client import GeminiClient  # noqa: E402
+
+PAYLOAD = {"contents": [{"parts": [{"text": "Write a story"}]}]}
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def run(name, call, calls, concurrency, fake):
+    before = dict(fake.stats)
+    latencies, failures = [], 0
+
+    def one(_):
+        started = time.perf_counter()
+        try:
+            call()
+        except Exception:
+            return None
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        for latency in pool.map(one, range(calls)):
+            if latency is None:
+                failures += 1
+            else:
+                latencies.append(latency)
+
+    return {
+        "client": name,
+        "calls": calls,
+        "failures": failures,
+        "upstream_requests": fake.stats["requests"] - before["requests"],
+        "connections_opened": fake.stats["connections"] - before["connections"],
+        "p50_ms": round(statistics.median(latencies) * 1000, 1) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.04)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--hedge-percentile", type=float, default=90)
+    parser.add_argument("--port", type=int, default=0, help="0 picks a free port")
+    args = parser.parse_args()
+
+    fake = FakeGemini(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, seed=7)
+    server = serve(fake, port=args.port)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1beta/models/gemini-2.0-flash"
+
+    def bare():
+        response = requests.post(f"{base_url}:generateContent", json=PAYLOAD, timeout=30,
+                                 headers={"x-goog-api-key": "fake"})
+        if response.status_code != 200:
+            raise RuntimeError(response.status_code)
+        return response.json()
+
+    pooled = GeminiClient("fake", base_url, pool_size=args.concurrency)
+    hedged = GeminiClient("fake", base_url, pool_size=args.concurrency,
+                          hedge_percentile=args.hedge_percentile)
+
+    results = [
+        run("requests.post", bare, args.calls, args.concurrency, fake),
+        run("GeminiClient", lambda: pooled.generate(PAYLOAD), args.calls, args.concurrency, fake),
+        run("GeminiClient+hedge", lambda: hedged.generate(PAYLOAD), args.calls, args.concurrency, fake),
+    ]
+    results[1]["stats"] = pooled.stats
+    results[2]["stats"] = hedged.stats
+    print(json.dumps(results, indent=2))
+
+    pooled.close()
+    hedged.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
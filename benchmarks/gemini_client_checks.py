@@ -0,0 +1,253 @@
+"""Behaviour checks for GeminiClient and AsyncGeminiClient against the fake Gemini.
+
+Each check drives a client against its own fake server and asserts on what
+the server saw: retries on 429/5xx and none on other errors, Retry-After
+honoured, connection failures retried a bounded number of times, the faster
+of a hedged pair winning and the slower one hung up on, cancelled calls raising GeminiCancelled at once
+and hanging up on the server, and the API key never in a URL. Prints each
+result and exits non-zero if any check fails, so it can gate releases:
+
+    python benchmarks/gemini_client_checks.py
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fake_gemini import FakeGemini, serve  # noqa: E402
+from load_test import free_port  # noqa: E402
+from async_gemini import AsyncGeminiClient  # noqa: E402
+from cancellation import CancelToken  # noqa: E402
+from gemini_client import GeminiClient, GeminiError, GeminiCancelled  # noqa: E402
+
+PAYLOAD = {"contents": [{"parts": [{"text": "Write a story"}]}]}
+CHECKS = []
+
+
+def check(fn):
+    CHECKS.append(fn)
+    return fn
+
+
+def fake_server(**knobs):
+    """(fake, base_url) of a fresh fake Gemini"""
+    fake = FakeGemini(**knobs)
+    server = serve(fake, port=0)
+    return fake, f"http://127.0.0.1:{server.server_address[1]}/v1beta/models/gemini-2.0-flash"
+
+
+def client(base_url, **options):
+    return GeminiClient("fake", base_url, **{"backoff": 0.01, "max_backoff": 0.05, **options})
+
+
+def failure(call):
+    """The GeminiError a call raised (or None), and how long it took"""
+    started = time.monotonic()
+    try:
+        call()
+    except GeminiError as e:
+        return e, time.monotonic() - started
+    return None, time.monotonic() - started
+
+
+def cancel_after(seconds):
+    cancel = CancelToken()
+    timer = threading.Timer(seconds, cancel.cancel, args=("interrupted",))
+    timer.daemon = True
+    timer.start()
+    return cancel
+
+
+@check
+def retries_rate_limits_and_server_errors():
+    results = {}
+    for status in (429, 500, 503):
+        fake, url = fake_server(error_rate=1.0, error_status=status)
+        gemini = client(url, max_retries=2)
+        error, _ = failure(lambda: gemini.generate(PAYLOAD))
+        results[status] = {"status": error and error.status, "requests": fake.stats["requests"],
+                           "retries": gemini.stats["retries"]}
+    ok = all(r == {"status": status, "requests": 3, "retries": 2} for status, r in results.items())
+    return ok, results
+
+
+@check
+def does_not_retry_client_errors():
+    fake, url = fake_server(error_rate=1.0, error_status=400)
+    gemini = client(url, max_retries=2)
+    error, _ = failure(lambda: gemini.generate(PAYLOAD))
+    return error is not None and error.status == 400 and fake.stats["requests"] == 1, \
+        {"status": error and error.status, "requests": fake.stats["requests"]}
+
+
+@check
+def recovers_after_transient_errors():
+    # Half the requests fail (seeded); enough retries get every call through
+    fake, url = fake_server(error_rate=0.5, seed=3)
+    gemini = client(url, max_retries=5)
+    answered = sum(1 for _ in range(20) if gemini.generate(PAYLOAD).get("candidates"))
+    return answered == 20 and gemini.stats["retries"] > 0, {"answered": answered, **gemini.stats}
+
+
+@check
+def honours_retry_after():
+    fake, url = fake_server(error_rate=1.0, error_status=503, retry_after=0.3)
+    gemini = client(url, max_retries=2, max_backoff=1.0)
+    error, elapsed = failure(lambda: gemini.generate(PAYLOAD))
+    # Two waits of at least Retry-After, where the backoff alone would be ~0.01s
+    return error is not None and elapsed >= 0.6, {"elapsed_s": round(elapsed, 3), "requests": fake.stats["requests"]}
+
+
+@check
+def caps_retry_after_at_max_backoff():
+    fake, url = fake_server(error_rate=1.0, error_status=429, retry_after=30)
+    gemini = client(url, max_retries=1, max_backoff=0.2)
+    error, elapsed = failure(lambda: gemini.generate(PAYLOAD))
+    return error is not None and 0.2 <= elapsed < 2, {"elapsed_s": round(elapsed, 3)}
+
+
+@check
+def bounded_retries_on_connection_errors():
+    # Nothing listens on a free port: every attempt is refused
+    gemini = client(f"http://127.0.0.1:{free_port()}/v1beta/models/gemini-2.0-flash", max_retries=3)
+    error, elapsed = failure(lambda: gemini.generate(PAYLOAD))
+    ok = error is not None and gemini.stats["requests"] == 4 and gemini.stats["failures"] == 1 and elapsed < 2
+    return ok, {"elapsed_s": round(elapsed, 3), **gemini.stats}
+
+
+@check
+def fastest_of_hedged_pair_wins():
+    fake, url = fake_server(latency=0.02)
+    gemini = client(url, hedge_percentile=90, hedge_min_samples=5)
+    for _ in range(5):
+        gemini.generate(PAYLOAD)
+    # The next request stalls for 2s; its hedge answers in 0.02s
+    fake.delays = [2.0, 0.02]
+    started = time.monotonic()
+    data = gemini.generate(PAYLOAD)
+    elapsed = time.monotonic() - started
+    ok = bool(data.get("candidates")) and elapsed < 0.5 and gemini.stats["hedges_won"] == 1
+    return ok, {"elapsed_s": round(elapsed, 3), **gemini.stats}
+
+
+@check
+def hedged_loser_is_cancelled():
+    fake, url = fake_server(latency=0.02)
+    gemini = client(url, hedge_percentile=90, hedge_min_samples=5)
+    for _ in range(5):
+        gemini.generate(PAYLOAD)
+    fake.delays = [2.0, 0.02]
+    gemini.generate(PAYLOAD)
+    # The stalled request is only seen to be hung up on once it tries to answer
+    time.sleep(2.1)
+    ok = gemini.stats["hedges_won"] == 1 and fake.stats["requests_aborted"] == 1
+    return ok, {**gemini.stats, "server": fake.stats}
+
+
+@check
+def cancel_aborts_generate_waiting_for_response():
+    fake, url = fake_server(latency=2.0)
+    gemini = client(url)
+    error, elapsed = failure(lambda: gemini.generate(PAYLOAD, cancel_after(0.1)))
+    time.sleep(2.1)
+    ok = isinstance(error, GeminiCancelled) and elapsed < 0.5 and fake.stats["requests_aborted"] == 1
+    return ok, {"raised": type(error).__name__, "elapsed_s": round(elapsed, 3), "server": fake.stats}
+
+
+@check
+def cancel_before_call_sends_nothing():
+    fake, url = fake_server()
+    gemini = client(url)
+    cancel = CancelToken()
+    cancel.cancel("interrupted")
+    error, _ = failure(lambda: gemini.generate(PAYLOAD, cancel))
+    return isinstance(error, GeminiCancelled) and fake.stats["requests"] == 0, {"requests": fake.stats["requests"]}
+
+
+@check
+def cancel_aborts_stream():
+    fake, url = fake_server(stream_delay=0.05)
+    gemini = client(url)
+    cancel, events = CancelToken(), []
+
+    def read():
+        for event in gemini.stream(PAYLOAD, cancel):
+            events.append(event)
+            if len(events) == 3:
+                cancel.cancel("interrupted")
+
+    error, _ = failure(read)
+    time.sleep(0.2)
+    ok = isinstance(error, GeminiCancelled) and len(events) == 3 and fake.stats["streams_aborted"] == 1
+    return ok, {"raised": type(error).__name__, "events": len(events), "server": fake.stats}
+
+
+@check
+def async_client_retries_and_cancels():
+    async def run():
+        fake, url = fake_server(error_rate=1.0, error_status=503)
+        gemini = AsyncGeminiClient("fake", url, max_retries=2, backoff=0.01, max_backoff=0.05)
+        try:
+            await gemini.generate(PAYLOAD)
+            retried = None
+        except GeminiError as e:
+            retried = {"status": e.status, "requests": fake.stats["requests"]}
+
+        fake, url = fake_server(latency=2.0)
+        gemini = AsyncGeminiClient("fake", url)
+        started = time.monotonic()
+        try:
+            await gemini.generate(PAYLOAD, cancel_after(0.1))
+            cancelled = None
+        except GeminiCancelled:
+            cancelled = round(time.monotonic() - started, 3)
+        return retried, cancelled
+
+    retried, cancelled = asyncio.run(run())
+    ok = retried == {"status": 503, "requests": 3} and cancelled is not None and cancelled < 0.5
+    return ok, {"retried": retried, "cancelled_after_s": cancelled}
+
+
+@check
+def api_key_never_in_url():
+    fake, url = fake_server()
+    client(url).generate(PAYLOAD)
+    list(client(url).stream(PAYLOAD))
+    client(url).warm_up()
+
+    async def run():
+        gemini = AsyncGeminiClient("fake", url)
+        await gemini.warm_up()
+        await gemini.generate(PAYLOAD)
+        [event async for event in gemini.stream(PAYLOAD)]
+    asyncio.run(run())
+    # The fake answers 403 to a key in the URL or a missing header
+    return fake.stats["unauthenticated"] == 0, {"server": fake.stats}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", help="run the checks whose names contain this")
+    args = parser.parse_args()
+
+    results, failed = {}, False
+    for fn in CHECKS:
+        if args.only and args.only not in fn.__name__:
+            continue
+        try:
+            ok, detail = fn()
+        except Exception as e:
+            ok, detail = False, {"error": repr(e)}
+        results[fn.__name__] = {"ok": ok, **detail}
+        failed |= not ok
+    print(json.dumps(results, indent=2, default=str))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Micro-benchmark: single-pass intent engine vs the original keyword scans.
+
+Prompts come from a JSONL file (each line's "prompt", "title" and "body"
+fields, split into sentences), by default the requests.jsonl backlog:
+
+    python benchmarks/intent_bench.py --prompts requests.jsonl --rounds 200
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from intent import IntentEngine  # noqa: E402
+
+SAMPLE_PROMPTS = [
+    "Tell me a story",
+    "Tell me a bedtime story about a sleepy owl",
+    "I want an adventure story about space pirates",
+    "Give me a funny story",
+    "What happens next?",
+    "Wait, make it scary instead",
+    "Tell me what we're doing tomorrow",
+]
+
+
+# The per-request scans main.py used before the intent engine
+def legacy_parse_story_request(user_input):
+    input_lower = user_input.lower().strip()
+    story_triggers = ["tell me a story", "tell a story", "story about",
+                      "a story about", "give me a story", "can you tell me"]
+    topic = input_lower
+    for trigger in story_triggers:
+        if input_lower.startswith(trigger):
+            topic = input_lower[len(trigger):].strip()
+            break
+    if topic.endswith(" please"):
+        topic = topic[:-7].strip()
+    if topic.endswith("."):
+        topic = topic[:-1].strip()
+    return topic
+
+
+def legacy_detect_voice_style(user_input):
+    input_lower = user_input.lower()
+    if any(word in input_lower for word in ["scary", "creepy", "spooky", "mystery", "secret"]):
+        return "mystery"
+    elif any(word in input_lower for word in ["funny", "silly", "comedy", "joke", "laugh"]):
+        return "comedy"
+    elif any(word in input_lower for word in ["adventure", "action", "exciting", "thrilling", "quest"]):
+        return "adventure"
+    elif any(word in input_lower for word in ["bedtime", "calm", "gentle", "soothing", "relaxing"]):
+        return "storyteller"
+    return None
+
+
+def legacy_parse(user_input):
+    return (
+        legacy_parse_story_request(user_input),
+        legacy_detect_voice_style(user_input),
+        any(word in user_input.lower() for word in
+            ['continue', 'next', 'what happens', 'go on', 'more', 'and then']),
+        any(word in user_input.lower() for word in
+            ['wait', 'stop', 'actually', 'change it', 'make it', 'instead']),
+    )
+
+
+def load_prompts(path):
+    if not path or not os.path.exists(path):
+        return SAMPLE_PROMPTS
+    prompts = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            for field in ("prompt", "title", "body"):
+                text = record.get(field)
+                if text:
+                    prompts.extend(s for s in re.split(r"(?<=[.!?])\s+", text) if s)
+    return prompts or SAMPLE_PROMPTS
+
+
+def main():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--prompts", default=os.path.join(root, "requests.jsonl"))
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    prompts = load_prompts(args.prompts)
+    # A fresh engine: the module-level parse_intent cache would make this unfair
+    engine = IntentEngine()
+
+    def run_legacy():
+        for prompt in prompts:
+            legacy_parse(prompt)
+
+    def run_engine():
+        for prompt in prompts:
+            engine.parse(prompt)
+
+    legacy = min(timeit.repeat(run_legacy, number=args.rounds, repeat=3))
+    new = min(timeit.repeat(run_engine, number=args.rounds, repeat=3))
+    calls = len(prompts) * args.rounds
+
+    disagreements = [
+        {"prompt": p, "legacy": legacy_parse(p)[2:], "engine": tuple(engine.parse(p))[2:]}
+        for p in prompts if legacy_parse(p)[2:] != tuple(engine.parse(p))[2:]
+    ]
+    print(json.dumps({
+        "prompts": len(prompts),
+        "legacy_us_per_prompt": round(legacy / calls * 1e6, 2),
+        "engine_us_per_prompt": round(new / calls * 1e6, 2),
+        "speedup": round(legacy / new, 2),
+        "continuation_interruption_disagreements": len(disagreements),
+        "examples": disagreements[:5],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
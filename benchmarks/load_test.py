@@ -0,0 +1,318 @@
+"""Load test main:app end to end against the local fake Gemini server.
+
+Starts the fake Gemini API, then for every server configuration launches the
+app (gunicorn with WORKERSxTHREADS, uvicorn asgi:app with WORKERS processes,
+or the Flask dev server), replays prompts
+from a requests.jsonl-style file with a fixed number of concurrent clients,
+and reports RPS, latency percentiles and time to the first SSE content chunk
+as JSON:
+
+    python benchmarks/load_test.py --configs 1x1,2x4,4x8 --modes json,stream \\
+        --requests 300 --concurrency 16 --latency 0.3 --output results.json
+
+Pass --baseline with an earlier results file to fail (exit 1) when RPS drops
+or p95 latency / time to first chunk grows by more than --tolerance.
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_gemini import FakeGemini, serve  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SAMPLE_PROMPTS = [
+    "Tell me a story",
+    "Tell me a bedtime story about a sleepy owl",
+    "I want an adventure story about space pirates",
+    "Give me a funny story about a cat who runs a bakery",
+    "Tell me a scary story about a lighthouse",
+    "What happens next?",
+]
+
+
+def load_prompts(path):
+    """One prompt per JSONL line: its "prompt", last user message, or "title" """
+    if not path or not os.path.exists(path):
+        return SAMPLE_PROMPTS
+    prompts = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            users = [m.get("content") for m in record.get("messages", []) if m.get("role") == "user"]
+            prompt = record.get("prompt") or (users[-1] if users else None) or record.get("title")
+            if prompt:
+                prompts.append(prompt)
+    return prompts or SAMPLE_PROMPTS
+
+
+def percentiles(samples):
+    if not samples:
+        return None
+    samples = sorted(samples)
+
+    def at(p):
+        return round(samples[min(len(samples) - 1, int(len(samples) * p / 100))] * 1000, 1)
+    return {"p50": at(50), "p95": at(95), "p99": at(99), "max": round(samples[-1] * 1000, 1)}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(kind, workers, threads, port, env):
+    if kind == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "-w", str(workers), "--threads", str(threads),
+                   "-b", f"127.0.0.1:{port}", "--log-level", "warning", "main:app"]
+    elif kind == "uvicorn":
+        command = [sys.executable, "-m", "uvicorn", "--workers", str(workers), "--host", "127.0.0.1",
+                   "--port", str(port), "--log-level", "warning", "asgi:app"]
+    else:
+        command = [sys.executable, "-m", "flask", "--app", "main", "run", "--port", str(port), "--with-threads"]
+    # The dev server logs every request to stderr; gunicorn only warnings
+    stderr = subprocess.DEVNULL if kind == "flask" else None
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=stderr)
+
+
+def wait_ready(base_url, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with status {process.returncode}")
+        try:
+            if requests.get(f"{base_url}/health", timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("server did not become ready")
+
+
+def one_request(session, url, prompt, streaming, session_id):
+    """(latency, time to first content chunk or None); raises on failure"""
+    body = {"messages": [{"role": "user", "content": prompt}], "stream": streaming, "session_id": session_id}
+    started = time.perf_counter()
+    if not streaming:
+        response = session.post(url, json=body, timeout=120)
+        response.raise_for_status()
+        if not response.json()["choices"][0]["message"]["content"]:
+            raise RuntimeError("empty story")
+        return time.perf_counter() - started, None
+
+    first = None
+    done = False
+    with session.post(url, json=body, stream=True, timeout=120) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(chunk_size=None):
+            if first is None and line.startswith(b"data:") and b'"content"' in line:
+                first = time.perf_counter() - started
+            done = done or line == b"data: [DONE]"
+    if not done or first is None:
+        raise RuntimeError("incomplete stream")
+    return time.perf_counter() - started, first
+
+
+def drive(url, prompts, streaming, count, concurrency, sessions, offset=0):
+    """Send ``count`` requests from ``concurrency`` clients; (latencies, first-chunk times, errors)"""
+    lock = threading.Lock()
+    issued = [0]
+    latencies, firsts, errors = [], [], []
+
+    def client():
+        session = requests.Session()
+        while True:
+            with lock:
+                if issued[0] >= count:
+                    return
+                index = offset + issued[0]
+                issued[0] += 1
+            session_id = f"load-{index % sessions}" if sessions else f"load-{uuid.uuid4().hex}"
+            try:
+                latency, first = one_request(session, url, prompts[index % len(prompts)], streaming, session_id)
+            except Exception as e:
+                with lock:
+                    errors.append(f"{type(e).__name__}: {e}")
+                continue
+            with lock:
+                latencies.append(latency)
+                if first is not None:
+                    firsts.append(first)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, firsts, errors
+
+
+def run_load(base_url, prompts, streaming, total, concurrency, sessions, warmup):
+    url = f"{base_url}/v1/chat/completions"
+    # Warm-up requests aren't measured, so connection setup and lazy starts don't count
+    if warmup:
+        drive(url, prompts, streaming, warmup, concurrency, sessions)
+
+    started = time.perf_counter()
+    latencies, firsts, errors = drive(url, prompts, streaming, total, concurrency, sessions, offset=warmup)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "error_examples": sorted(set(errors))[:3],
+        "duration_s": round(elapsed, 2),
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "latency_ms": percentiles(latencies),
+        "first_chunk_ms": percentiles(firsts) if streaming else None,
+    }
+
+
+def run_key(run):
+    return (run["server"], run["workers"], run["threads"], run["mode"], run["concurrency"])
+
+
+def regressions(runs, baseline, tolerance):
+    """Runs that got slower than the matching baseline run by more than tolerance"""
+    previous = {run_key(run): run for run in baseline.get("runs", [])}
+    found = []
+    for run in runs:
+        before = previous.get(run_key(run))
+        if not before:
+            continue
+        checks = [("rps", run["rps"], before["rps"], False)]
+        for field in ("latency_ms", "first_chunk_ms"):
+            if run.get(field) and before.get(field):
+                checks.append((f"{field}.p95", run[field]["p95"], before[field]["p95"], True))
+        for name, now, then, lower_is_better in checks:
+            if not now or not then:
+                continue
+            worse = now > then * (1 + tolerance) if lower_is_better else now < then * (1 - tolerance)
+            if worse:
+                found.append({"run": list(run_key(run)), "metric": name, "baseline": then, "now": now})
+    return found
+
+
+def parse_configs(text, server):
+    """[(workers, threads)] from "1x1,2x4"; a bare "2" is (2, 0), for uvicorn"""
+    configs = []
+    for config in text.split(","):
+        workers, _, threads = config.strip().partition("x")
+        if not workers.isdigit() or not (threads.isdigit() or not threads and server != "gunicorn"):
+            raise ValueError(f"bad config {config!r}: expected WORKERSxTHREADS"
+                             + ("" if server == "gunicorn" else " or WORKERS"))
+        configs.append((int(workers), int(threads or 0)))
+    return configs
+
+
+def parse_modes(text):
+    """["json", "stream"] from "json", "stream", "both" or a comma-separated list"""
+    modes = []
+    for mode in text.split(","):
+        mode = mode.strip()
+        if mode not in ("json", "stream", "both"):
+            raise ValueError(f"unknown mode {mode!r}: expected json, stream or both")
+        modes.extend(["json", "stream"] if mode == "both" else [mode])
+    return list(dict.fromkeys(modes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--server", choices=["gunicorn", "uvicorn", "flask"], default="gunicorn")
+    parser.add_argument("--configs", default="1x1,2x4",
+                        help="comma-separated gunicorn WORKERSxTHREADS (uvicorn: only WORKERS counts, so a bare "
+                             "WORKERS will do; ignored for --server flask)")
+    parser.add_argument("--modes", default="json,stream", help="json, stream or both")
+    parser.add_argument("--prompts", default=os.path.join(ROOT, "requests.jsonl"))
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per run")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--sessions", type=int, default=0,
+                        help="reuse this many session ids (0: a new session per request)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the app, e.g. STORY_CACHE_SIZE=100")
+    parser.add_argument("--gemini-url", help="use an already running fake Gemini at this base URL")
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--stream-delay", type=float, default=0.02)
+    parser.add_argument("--first-chunk-delay", type=float, default=0.1)
+    parser.add_argument("--words", type=int, default=250)
+    parser.add_argument("--output", help="also write the results JSON here")
+    parser.add_argument("--baseline", help="results JSON from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+    try:
+        configs = [(1, 0)] if args.server == "flask" else parse_configs(args.configs, args.server)
+        modes = parse_modes(args.modes)
+    except ValueError as e:
+        parser.error(str(e))
+
+    fake_config = {"latency": args.latency, "jitter": args.jitter, "error_rate": args.error_rate,
+                   "stream_delay": args.stream_delay, "first_chunk_delay": args.first_chunk_delay,
+                   "words": args.words}
+    fake = server = None
+    gemini_url = args.gemini_url
+    if not gemini_url:
+        fake = FakeGemini(args.latency, args.jitter, args.error_rate, stream_delay=args.stream_delay,
+                          words=args.words, seed=7, first_chunk_delay=args.first_chunk_delay)
+        server = serve(fake, port=0)
+        gemini_url = f"http://127.0.0.1:{server.server_address[1]}/v1beta/models/gemini-2.0-flash"
+
+    env = dict(os.environ, GEMINI_API_KEY="fake", GEMINI_BASE_URL=gemini_url)
+    env.update(pair.split("=", 1) for pair in args.env)
+
+    prompts = load_prompts(args.prompts)
+    runs = []
+    for workers, threads in configs:
+        port = free_port()
+        process = start_server(args.server, workers, threads, port, env)
+        try:
+            wait_ready(f"http://127.0.0.1:{port}", process)
+            for mode in modes:
+                before = dict(fake.stats) if fake else None
+                result = run_load(f"http://127.0.0.1:{port}", prompts, mode == "stream", args.requests,
+                                  args.concurrency, args.sessions, args.warmup)
+                run = {"server": args.server, "workers": workers, "threads": threads, "mode": mode,
+                       "concurrency": args.concurrency, **result}
+                if fake:
+                    run["upstream"] = {key: fake.stats[key] - before[key] for key in before}
+                runs.append(run)
+                print(f"{args.server} {workers}x{threads} {mode}: {run['rps']} rps, "
+                      f"p95 {(run['latency_ms'] or {}).get('p95')} ms, {run['errors']} errors", file=sys.stderr)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    results = {"timestamp": int(time.time()), "fake_gemini": None if args.gemini_url else fake_config,
+               "prompts": len(prompts), "runs": runs}
+    failed = False
+    if args.baseline:
+        with open(args.baseline) as f:
+            results["regressions"] = regressions(runs, json.load(f), args.tolerance)
+        failed = bool(results["regressions"])
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+    if server:
+        server.shutdown()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Offline story engine: generation time, length and determinism per voice style.
+
+Generates --stories stories per style, one seed each, and prints time per
+story (p50/p99/max), word counts and how many distinct stories came out.
+Exits non-zero if p99 reaches --budget-ms, a story falls outside 200-300
+words, or a seed doesn't reproduce its story:
+
+    python benchmarks/offline_story_bench.py --stories 2000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from story_engine import BANKS, StoryEngine  # noqa: E402
+
+TOPICS = ["a sleepy owl", "space pirates", "a haunted lighthouse", "a cat who runs a bakery",
+          "a dragon who is afraid of the dark", "the last train to the moon"]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stories", type=int, default=1000, help="stories per style")
+    parser.add_argument("--budget-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    engine = StoryEngine()
+    results, failed = {}, False
+    for style in BANKS:
+        times, words, stories = [], [], set()
+        for seed in range(args.stories):
+            topic = TOPICS[seed % len(TOPICS)]
+            started = time.perf_counter()
+            story = engine.story(topic, style, seed)
+            times.append(time.perf_counter() - started)
+            words.append(len(story.split()))
+            stories.add(story)
+        continuations = [len(engine.continuation(style, seed).split()) for seed in range(args.stories)]
+        reproducible = all(engine.story(TOPICS[0], style, seed) == engine.story(TOPICS[0], style, seed)
+                           for seed in range(50))
+        results[style] = {
+            "ms": {"p50": round(percentile(times, 50) * 1000, 3), "p99": round(percentile(times, 99) * 1000, 3),
+                   "max": round(max(times) * 1000, 3)},
+            "words": {"min": min(words), "mean": round(sum(words) / len(words)), "max": max(words)},
+            "continuation_words": {"min": min(continuations), "max": max(continuations)},
+            "distinct": len(stories),
+            "reproducible": reproducible,
+        }
+        failed |= percentile(times, 99) * 1000 >= args.budget_ms or min(words) < 200 or max(words) > 300 \
+            or not reproducible
+
+    print(json.dumps(results, indent=2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
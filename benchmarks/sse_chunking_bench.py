@@ -0,0 +1,175 @@
+"""Benchmark: phrase-aligned SSE chunking vs the fixed 2-3 word policy.
+
+For finished stories (cache, warm pool, fallback: paced by the client's
+delay hints) and for Gemini streams (simulated deltas), compares chunk
+count, serialization CPU (chunking plus frames) and simulated time until a
+TTS engine holds its first speakable phrase. The TTS model speaks once its
+text ends at a sentence or clause boundary, or holds --tts-max-words words.
+
+    python benchmarks/sse_chunking_bench.py --stories 50 --rounds 20
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("METRICS_DIR", "off")
+import main as talespin  # noqa: E402
+from chunking import PhraseChunker, ends_phrase  # noqa: E402
+from fake_gemini import FakeGemini  # noqa: E402
+
+
+# The frames main.py built before the templates
+def legacy_content_frame(chunk, delay=0):
+    frame = {"choices": [{"delta": {"content": chunk}}]}
+    if delay:
+        frame["pacing"] = {"delay_ms": int(delay * 1000)}
+    return f'data: {json.dumps(frame)}\n\n'
+
+
+def first_phrase_time(arrivals, tts_max_words):
+    """Seconds until the received text ends at a boundary or reaches tts_max_words"""
+    words = 0
+    for at, chunk in arrivals:
+        words += len(chunk.split())
+        if ends_phrase(chunk) or words >= tts_max_words:
+            return at
+    return arrivals[-1][0] if arrivals else 0.0
+
+
+def mid_phrase(chunks):
+    """Chunks (the last excepted) that stop part way through a phrase"""
+    return sum(1 for chunk in chunks[:-1] if not ends_phrase(chunk))
+
+
+def replay_arrivals(pieces):
+    """Client pacing: each chunk is released after the previous ones' delays"""
+    at, arrivals = 0.0, []
+    for chunk, delay in pieces:
+        arrivals.append((at, chunk))
+        at += delay
+    return arrivals
+
+
+def gemini_deltas(story, rng, first_delta, interval):
+    """(arrival time, text) deltas of 3-8 words, cut without regard to phrases"""
+    words = story.split(" ")
+    deltas, i, at = [], 0, first_delta
+    while i < len(words):
+        n = rng.randint(3, 8)
+        text = " ".join(words[i:i + n])
+        i += n
+        deltas.append((at, text + (" " if i < len(words) else "")))
+        at += interval
+    return deltas
+
+
+def phrase_arrivals(deltas):
+    chunker = PhraseChunker()
+    arrivals = [(at, chunk) for at, text in deltas for chunk in chunker.feed(text)]
+    return arrivals + [(deltas[-1][0], chunk) for chunk in chunker.flush()]
+
+
+def mean(values):
+    return round(sum(values) / len(values), 3) if values else None
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else None
+
+
+def summarize(times, chunk_counts, mid_counts, cpu_seconds, stories):
+    return {
+        "chunks_per_story": mean(chunk_counts),
+        "mid_phrase_chunks_per_story": mean(mid_counts),
+        "first_phrase_ms": {"mean": round(mean(times) * 1000, 1), "p50": round(percentile(times, 50) * 1000, 1),
+                            "p95": round(percentile(times, 95) * 1000, 1)},
+        "cpu_us_per_story": round(cpu_seconds / stories * 1e6, 1),
+    }
+
+
+def load_stories(count, words):
+    stories = [FakeGemini(words=words, seed=i).story(i) for i in range(count // 2)]
+    topics = ["a sleepy owl", "space pirates", "a haunted lighthouse", "a cat who runs a bakery"]
+    styles = list(talespin.VOICE_PERSONALITIES)
+    random.seed(7)
+    while len(stories) < count:
+        stories.append(talespin.create_fallback_story(random.choice(topics), random.choice(styles)))
+    return stories
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stories", type=int, default=40)
+    parser.add_argument("--words", type=int, default=250, help="words per generated story")
+    parser.add_argument("--rounds", type=int, default=20, help="timing repetitions")
+    parser.add_argument("--style", default="storyteller", help="voice style for pacing")
+    parser.add_argument("--tts-max-words", type=int, default=8,
+                        help="words after which the simulated TTS speaks without a boundary")
+    parser.add_argument("--first-delta", type=float, default=0.3, help="Gemini's first delta (seconds)")
+    parser.add_argument("--delta-interval", type=float, default=0.05, help="seconds between Gemini deltas")
+    args = parser.parse_args()
+
+    stories = load_stories(args.stories, args.words)
+    talespin.STREAM_PACING = "client"
+    results = {"stories": len(stories), "style": args.style, "tts_max_words": args.tts_max_words}
+
+    # Finished stories, paced by the client
+    replay = {}
+    for policy in ("words", "phrase"):
+        talespin.STREAM_CHUNKING = policy
+        frame = talespin.sse_content_frame if policy == "phrase" else legacy_content_frame
+        pieces = [list(talespin.story_chunks(story, args.style)) for story in stories]
+
+        def serialize():
+            for story in stories:
+                for chunk, delay in talespin.story_chunks(story, args.style):
+                    frame(chunk, delay)
+
+        cpu = min(timeit.repeat(serialize, number=args.rounds, repeat=5)) / args.rounds
+        replay[policy] = summarize(
+            [first_phrase_time(replay_arrivals(p), args.tts_max_words) for p in pieces],
+            [len(p) for p in pieces], [mid_phrase([chunk for chunk, _ in p]) for p in pieces],
+            cpu, len(stories))
+    results["finished_stories"] = replay
+
+    # Gemini streams: deltas passed through as they come vs regrouped into phrases
+    rng = random.Random(11)
+    streams = [gemini_deltas(story, rng, args.first_delta, args.delta_interval) for story in stories]
+    streamed = {}
+    for policy in ("words", "phrase"):
+        arrivals = [phrase_arrivals(d) if policy == "phrase" else d for d in streams]
+        frame = talespin.sse_content_frame if policy == "phrase" else legacy_content_frame
+
+        def serialize():
+            for deltas in streams:
+                chunks = phrase_arrivals(deltas) if policy == "phrase" else deltas
+                for _, chunk in chunks:
+                    frame(chunk)
+
+        cpu = min(timeit.repeat(serialize, number=args.rounds, repeat=5)) / args.rounds
+        streamed[policy] = summarize(
+            [first_phrase_time(a, args.tts_max_words) for a in arrivals],
+            [len(a) for a in arrivals], [mid_phrase([chunk for _, chunk in a]) for a in arrivals],
+            cpu, len(stories))
+    results["gemini_streams"] = streamed
+
+    # Framing alone, the same chunks both ways
+    chunks = [chunk for story in stories for chunk, _ in talespin.story_chunks(story, args.style)]
+    legacy = min(timeit.repeat(lambda: [legacy_content_frame(c, 0.045) for c in chunks], number=args.rounds, repeat=5))
+    template = min(timeit.repeat(lambda: [talespin.sse_content_frame(c, 0.045) for c in chunks], number=args.rounds, repeat=5))
+    calls = len(chunks) * args.rounds
+    results["frame_us"] = {"json_dumps": round(legacy / calls * 1e6, 3), "template": round(template / calls * 1e6, 3),
+                           "speedup": round(legacy / template, 2)}
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Cooperative cancellation of in-flight story requests"""
+import threading
+
+
+class CancelToken:
+    """Set once when a request's work should stop; long waits should go through ``wait``.
+
+    Callbacks registered with ``on_cancel`` run when it's cancelled, which is how
+    blocking reads (an upstream stream) get woken up.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self.reason = None
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self, reason):
+        """Cancel with a reason; False if it already was"""
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Cancel callback error: {e}")
+        return True
+
+    def on_cancel(self, callback):
+        """Run callback on cancellation (now, if already cancelled); returns a remover"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def _remove(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def wait(self, timeout):
+        """Sleep for up to timeout seconds; True if cancelled meanwhile"""
+        return self._event.wait(timeout)
+
+
+class RequestRegistry:
+    """In-flight requests per session, so a new turn can cancel the old ones"""
+
+    def __init__(self):
+        self._active = {}
+        self._lock = threading.Lock()
+        self.counters = {"interrupted": 0, "disconnected": 0}
+
+    def begin(self, session_id):
+        token = CancelToken()
+        with self._lock:
+            self._active.setdefault(session_id, set()).add(token)
+        return token
+
+    def end(self, session_id, token):
+        with self._lock:
+            tokens = self._active.get(session_id)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self._active[session_id]
+
+    def cancel_session(self, session_id, reason="interrupted"):
+        """Cancel every in-flight request for the session; returns how many"""
+        with self._lock:
+            tokens = list(self._active.get(session_id, ()))
+        cancelled = sum(1 for token in tokens if token.cancel(reason))
+        self.count(reason, cancelled)
+        return cancelled
+
+    def count(self, reason, amount=1):
+        with self._lock:
+            self.counters[reason] = self.counters.get(reason, 0) + amount
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": sum(len(tokens) for tokens in self._active.values()), **self.counters}
@@ -0,0 +1,96 @@
+"""Phrase-aligned chunking of story text for streaming into text-to-speech"""
+import re
+
+# A word and the whitespace after it
+WORD = re.compile(r'\S+\s*')
+# Closing quotes/brackets may follow the punctuation: 'said "Run!"' ends a sentence
+SENTENCE_END = re.compile(r'[.!?…]+["\'”’)\]]*$')
+CLAUSE_END = re.compile(r'(?:[,;:]|—|–|--)["\'”’)\]]*$')
+# Last characters that can end a boundary; most words end in a letter and skip the regexes
+BOUNDARY_CHARS = set('.!?…,;:—–-"\'”’)]')
+ABBREVIATIONS = {"mr.", "mrs.", "ms.", "dr.", "st.", "mt.", "prof.", "sr.", "jr.", "vs.", "e.g.", "i.e."}
+
+
+class PhraseChunker:
+    """Regroups text, fed in any pieces, into chunks ending at sentence or clause boundaries.
+
+    The first chunk ends at the first boundary or after ``first_words`` words,
+    whichever comes first, so speech can start early. After that a chunk ends
+    at a sentence end, at a clause boundary once it has ``min_words`` words, or
+    at ``max_words`` words regardless. Text is passed through unchanged, so
+    the chunks join back into exactly what was fed.
+    """
+
+    def __init__(self, first_words=4, min_words=4, max_words=16):
+        self.first_words = first_words
+        self.min_words = min_words
+        self.max_words = max_words
+        self.chunks = 0
+        self._pending = ""
+        self._words = []
+
+    def feed(self, text):
+        """Chunks completed by ``text`` (a list, often empty)"""
+        self._pending += text
+        stripped = self._pending.lstrip()
+        lead = self._pending[:len(self._pending) - len(stripped)]
+        words = WORD.findall(stripped)
+        # The last word may carry on in the next piece
+        self._pending = words.pop() if words and not words[-1][-1].isspace() else ""
+        if lead:
+            if self._words:
+                self._words[-1] += lead
+            elif words:
+                words[0] = lead + words[0]
+            else:
+                self._pending = lead + self._pending
+
+        ready = []
+        for word in words:
+            self._words.append(word)
+            if self._ends_chunk(word.rstrip()):
+                ready.append(self._cut())
+        return ready
+
+    def flush(self):
+        """Whatever is left, as a final chunk (a list, empty if nothing is)"""
+        self._words.append(self._pending)
+        self._pending = ""
+        chunk = self._cut()
+        return [chunk] if chunk.strip() else []
+
+    def _ends_chunk(self, word):
+        count = len(self._words)
+        if word[-1] not in BOUNDARY_CHARS:
+            return count >= (self.first_words if self.chunks == 0 else self.max_words)
+        if is_sentence_end(word):
+            return True
+        if self.chunks == 0:
+            return count >= self.first_words or bool(CLAUSE_END.search(word))
+        return count >= self.max_words or (count >= self.min_words and bool(CLAUSE_END.search(word)))
+
+    def _cut(self):
+        chunk = "".join(self._words)
+        self._words = []
+        self.chunks += 1
+        return chunk
+
+
+def phrase_chunks(text, **options):
+    """All of a finished text's chunks, as PhraseChunker would stream them"""
+    chunker = PhraseChunker(**options)
+    return chunker.feed(text) + chunker.flush()
+
+
+def is_sentence_end(word):
+    return bool(SENTENCE_END.search(word)) and word.lower() not in ABBREVIATIONS
+
+
+def ends_phrase(chunk):
+    """Whether a chunk stops at a sentence or clause boundary"""
+    words = chunk.split()
+    return bool(words) and (is_sentence_end(words[-1]) or bool(CLAUSE_END.search(words[-1])))
+
+
+def word_count(chunk):
+    return len(chunk.split())
@@ -0,0 +1,72 @@
+"""Session identity for chat requests that carry their history but no session id.
+
+A rolling SHA-256 over the ``messages`` gives every point in a conversation
+a key. Conversations that open the same way share keys until their replies
+differ, so state is never kept under a history key alone: each served
+reply is filed under reply_key(key of the history it answered, reply),
+pointing at the conversation's session, and the next request finds it
+from the history it brings back.
+"""
+import hashlib
+
+# How much of a reply its filing key covers: clients may echo back only what
+# was spoken, so the key can't depend on the whole of it
+REPLY_KEY_WORDS = 12
+
+
+def normalize(content):
+    """Message text with whitespace evened out, as clients tend to reflow it"""
+    return " ".join(str(content or "").split())
+
+
+def session_key(digest):
+    return f"conv_{digest.hexdigest()[:32]}"
+
+
+def reply_key(history_key, reply):
+    """Where a reply to the history with ``history_key`` is filed"""
+    opening = " ".join(normalize(reply).split()[:REPLY_KEY_WORDS])
+    digest = hashlib.sha256(f"{history_key}\x1d{opening}".encode('utf-8'))
+    return f"reply_{digest.hexdigest()[:32]}"
+
+
+class ChatHistory:
+    """A chat request's messages: the new user turns and the session keys around them.
+
+    ``key`` is the key of the whole history, what this request's reply gets
+    filed against; ``previous_key`` is the key the last request's reply was
+    filed against, if there was a last request, and ``reply`` is what it
+    answered, to check the session found by (see continues()).
+    """
+
+    def __init__(self, messages):
+        messages = [m for m in messages if isinstance(m, dict)]
+        last_reply = max((i for i, m in enumerate(messages) if m.get('role') == 'assistant'), default=-1)
+        self.previous_key = None
+        self.reply = None
+        digest = hashlib.sha256()
+        for index, message in enumerate(messages):
+            if index == last_reply:
+                self.previous_key = session_key(digest.copy())
+                self.reply = normalize(message.get('content'))
+            digest.update(f"{message.get('role')}\x1f{normalize(message.get('content'))}\x1e".encode('utf-8'))
+        self.key = session_key(digest)
+
+        users = [m.get('content') for m in messages if m.get('role') == 'user' and m.get('content')]
+        # Only what was said since the last reply is new; earlier turns were answered already
+        self.new_turns = [m.get('content') for m in messages[last_reply + 1:]
+                          if m.get('role') == 'user' and m.get('content')]
+        self.message = " ".join(self.new_turns) if self.new_turns else (users[-1] if users else None)
+
+    @property
+    def reply_key(self):
+        """Where the last request filed its reply, or None on a first turn"""
+        return reply_key(self.previous_key, self.reply) if self.previous_key else None
+
+    def continues(self, last_story):
+        """Whether a session whose last story was ``last_story`` gave this history's reply.
+
+        Clients may keep only the part that was spoken, so a reply cut short
+        still matches.
+        """
+        return bool(self.reply) and normalize(last_story).startswith(self.reply)
@@ -0,0 +1,344 @@
+"""Pooled, retrying, hedged HTTP client for the Gemini API"""
+import json
+import random
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from cancellation import CancelToken
+
+# Worth retrying: rate limiting and transient server-side failures
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class GeminiError(Exception):
+    """Gemini call that failed for good (after any retries)"""
+
+    def __init__(self, message, status=None, timeout=False):
+        super().__init__(message)
+        self.status = status
+        self.timeout = timeout
+
+
+class GeminiCancelled(GeminiError):
+    """The caller cancelled the request before it finished"""
+
+
+# The CancelToken of the call each thread is making (see _post)
+_current = threading.local()
+
+
+def _cancellable_adapter(pool_size):
+    """HTTPAdapter whose connections a call's CancelToken can abort while the
+    response hasn't started yet, which is most of a generateContent call.
+
+    requests has no hook between sending a request and its response headers,
+    so the urllib3 connections themselves watch the calling thread's token.
+    """
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    class Cancellable:
+        def getresponse(self, *args, **kwargs):
+            cancel = getattr(_current, 'cancel', None)
+            remove = cancel.on_cancel(self._abort) if cancel is not None else None
+            try:
+                return super().getresponse(*args, **kwargs)
+            finally:
+                if remove:
+                    remove()
+
+        def _abort(self):
+            # shutdown() wakes a reader blocked in recv; close() alone doesn't
+            if self.sock is not None:
+                try:
+                    self.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    class CancellableHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = type("CancellableHTTPConnection", (Cancellable, HTTPConnection), {})
+
+    class CancellableHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = type("CancellableHTTPSConnection", (Cancellable, HTTPSConnection), {})
+
+    class Adapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {"http": CancellableHTTPConnectionPool,
+                                                     "https": CancellableHTTPSConnectionPool}
+
+    return Adapter(pool_connections=1, pool_maxsize=pool_size)
+
+
+def _abort_on_cancel(response, cancel):
+    """Shut a started response's connection down if ``cancel`` fires; returns a remover"""
+    def abort():
+        # shutdown() wakes a reader blocked in recv; close() alone doesn't
+        shutdown = getattr(response.raw, 'shutdown', None)
+        (shutdown or response.close)()
+
+    return cancel.on_cancel(abort) if cancel is not None else None
+
+
+class GeminiClient:
+    """Shared Gemini client: one keep-alive pool, bounded retries, optional hedging.
+
+    The connection pool lives in a single HTTPAdapter that every thread mounts,
+    so connections are reused across requests and workers' threads. Each thread
+    gets its own Session on top of it, since Session itself isn't thread-safe.
+
+    requests is imported with the first session rather than with this module:
+    it's a fifth of the app's import time, and the ASGI app never needs it.
+
+    Cancelling a call's CancelToken shuts its connection down at any point,
+    waiting for the response included, so Gemini stops generating at once.
+
+    Hedging: once enough latencies have been observed, a request that hasn't
+    answered by the ``hedge_percentile`` latency gets a duplicate, and whichever
+    finishes first wins; the other is cancelled.
+    """
+
+    def __init__(self, api_key, base_url, pool_size=10, max_retries=2,
+                 backoff=0.25, max_backoff=4.0, connect_timeout=5,
+                 read_timeout=30, hedge_percentile=None, hedge_min_samples=20):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = (connect_timeout, read_timeout)
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+
+        self.pool_size = pool_size
+        self._adapter = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=200)
+        self._hedge_pool = None
+        if hedge_percentile:
+            self._hedge_pool = ThreadPoolExecutor(max_workers=pool_size * 2,
+                                                  thread_name_prefix="gemini-hedge")
+
+        self.stats = {"requests": 0, "retries": 0, "failures": 0,
+                      "hedges_sent": 0, "hedges_won": 0}
+
+    @property
+    def session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+            with self._lock:
+                if self._adapter is None:
+                    self._adapter = _cancellable_adapter(self.pool_size)
+            session = requests.Session()
+            # In a header rather than the URL, which turns up in error messages and logs
+            session.headers['x-goog-api-key'] = self.api_key
+            session.mount('http://', self._adapter)
+            session.mount('https://', self._adapter)
+            self._local.session = session
+        return session
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _sleep_before_retry(self, attempt, response=None, cancel=None):
+        """Full-jitter exponential backoff, honouring Retry-After when given"""
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+        if response is not None:
+            try:
+                delay = max(delay, min(self.max_backoff, float(response.headers.get('Retry-After', 0))))
+            except ValueError:
+                pass
+        if cancel is None:
+            time.sleep(delay)
+        elif cancel.wait(delay):
+            raise GeminiCancelled("Gemini request cancelled")
+
+    def _post(self, method, payload, sse=False, cancel=None, deadline=None):
+        """POST with bounded retries; returns a 200 response or raises GeminiError.
+
+        ``cancel`` (a CancelToken) stops it between attempts and aborts the
+        attempt under way, even one still waiting for the response to start.
+        ``deadline`` (a time.monotonic() value) caps each attempt's read timeout,
+        which also bounds the wait for the response to start.
+        """
+        import requests
+        url = f"{self.base_url}:{method}"
+        params = {"alt": "sse"} if sse else {}
+
+        for attempt in range(self.max_retries + 1):
+            last_try = attempt == self.max_retries
+            if cancel is not None and cancel.cancelled:
+                raise GeminiCancelled("Gemini request cancelled")
+            self._count("requests")
+            timeout = self.timeout
+            if deadline is not None:
+                timeout = (timeout[0], max(0.001, min(timeout[1], deadline - time.monotonic())))
+            _current.cancel = cancel
+            try:
+                # The body is left to the caller to read, which a cancel can cut short
+                response = self.session.post(url, params=params, json=payload,
+                                             timeout=timeout, stream=True)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if cancel is not None and cancel.cancelled:
+                    raise GeminiCancelled("Gemini request cancelled") from e
+                if last_try:
+                    self._count("failures")
+                    raise GeminiError(f"Gemini request failed: {e}",
+                                      timeout=isinstance(e, requests.exceptions.Timeout)) from e
+                self._count("retries")
+                self._sleep_before_retry(attempt, cancel=cancel)
+                continue
+            finally:
+                _current.cancel = None
+
+            if response.status_code == 200:
+                return response
+
+            response.close()
+            if response.status_code not in RETRYABLE_STATUS or last_try:
+                self._count("failures")
+                raise GeminiError(f"Gemini API error: {response.status_code}",
+                                  status=response.status_code)
+            self._count("retries")
+            self._sleep_before_retry(attempt, response, cancel)
+
+    def _generate_once(self, payload, cancel=None, deadline=None):
+        import requests
+        started = time.monotonic()
+        response = self._post("generateContent", payload, cancel=cancel, deadline=deadline)
+        remove = _abort_on_cancel(response, cancel)
+        try:
+            with response:
+                data = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            if cancel is not None and cancel.cancelled:
+                raise GeminiCancelled("Gemini request cancelled") from e
+            raise GeminiError(f"Gemini response failed: {e}",
+                              timeout=isinstance(e, requests.exceptions.Timeout)) from e
+        finally:
+            if remove:
+                remove()
+        with self._lock:
+            self._latencies.append(time.monotonic() - started)
+        return data
+
+    def latency_percentile(self, percentile):
+        """Observed generateContent latency at a percentile (seconds), or None"""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * percentile / 100))
+        return samples[index]
+
+    def hedge_delay(self):
+        """How long to wait before hedging, or None when hedging is off or not yet calibrated"""
+        if not self.hedge_percentile:
+            return None
+        with self._lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return None
+        return self.latency_percentile(self.hedge_percentile)
+
+    def generate(self, payload, cancel=None, deadline=None):
+        """generateContent call; returns the decoded JSON body"""
+        hedge_after = self.hedge_delay()
+        if hedge_after is None:
+            return self._generate_once(payload, cancel, deadline)
+
+        attempts = {}
+        first = self._attempt(payload, cancel, deadline, attempts)
+        done, pending = wait({first}, timeout=hedge_after)
+        hedge = None
+        if not done:
+            self._count("hedges_sent")
+            hedge = self._attempt(payload, cancel, deadline, attempts)
+            pending.add(hedge)
+
+        error = None
+        try:
+            while True:
+                for future in done:
+                    if future.exception() is None:
+                        if future is hedge:
+                            self._count("hedges_won")
+                        return future.result()
+                    error = future.exception()
+                if not pending:
+                    raise error
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        finally:
+            # Whichever attempt is still running lost: stop Gemini generating it
+            for token in attempts.values():
+                token.cancel("hedge lost")
+
+    def _attempt(self, payload, cancel, deadline, attempts):
+        """Start a hedged attempt with its own token, cancelled with ``cancel`` too"""
+        token = CancelToken()
+        remove = cancel.on_cancel(lambda: token.cancel(cancel.reason)) if cancel is not None else None
+        future = self._hedge_pool.submit(self._generate_once, payload, token, deadline)
+        if remove:
+            future.add_done_callback(lambda _: remove())
+        attempts[future] = token
+        return future
+
+    def stream(self, payload, cancel=None, deadline=None):
+        """streamGenerateContent call; yields each decoded SSE event.
+
+        Retries only cover getting the stream started, never a half-read one.
+        Cancelling ``cancel`` shuts the connection down, so a read blocked on
+        the next event returns at once and Gemini stops generating. ``deadline``
+        only bounds the wait for the response to start.
+        """
+        response = self._post("streamGenerateContent", payload, sse=True, cancel=cancel, deadline=deadline)
+        if deadline is not None:
+            # Reads of the body itself get the usual timeout again
+            sock = getattr(getattr(response.raw, 'connection', None), 'sock', None)
+            if sock is not None:
+                sock.settimeout(self.timeout[1])
+
+        remove = _abort_on_cancel(response, cancel)
+        try:
+            with response:
+                # chunk_size=None hands us bytes as soon as they come off the socket
+                for line in response.iter_lines(chunk_size=None):
+                    if line.startswith(b'data:'):
+                        yield json.loads(line[5:].decode('utf-8'))
+            if cancel is not None and cancel.cancelled:
+                raise GeminiCancelled("Gemini stream cancelled")
+        except GeminiCancelled:
+            raise
+        except Exception as e:
+            if cancel is not None and cancel.cancelled:
+                raise GeminiCancelled("Gemini stream cancelled") from e
+            raise
+        finally:
+            if remove:
+                remove()
+
+    def warm_up(self):
+        """Open a pooled connection before the first real call; True if Gemini answered.
+
+        A GET on the model (its metadata) costs no tokens but does the DNS,
+        TCP and TLS work the first generate would otherwise wait for.
+        """
+        import requests
+        try:
+            response = self.session.get(self.base_url, timeout=self.timeout)
+            response.close()
+            return True
+        except requests.exceptions.RequestException:
+            return False
+
+    def close(self):
+        if self._adapter is not None:
+            self._adapter.close()
+        if self._hedge_pool:
+            self._hedge_pool.shutdown(wait=False)
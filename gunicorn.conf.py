@@ -0,0 +1,38 @@
+"""gunicorn settings for the web process (see Procfile).
+
+On Cloud Run an instance starts from zero when a request arrives, so
+startup time is user-facing latency. With GUNICORN_PRELOAD (default on) the
+master imports the app and does the static part of main.warm_up() once,
+before forking, so workers start with it done. Each worker then opens its
+own Gemini connection: connections can't be shared across a fork.
+WARMUP=0 skips the warm-up.
+
+Workers are threaded (GUNICORN_THREADS each): with one thread a worker
+streaming a story can't take the request that interrupts it, so the
+interruption would only be seen once the stream it means to cancel is over.
+"""
+import os
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+
+def on_starting(server):
+    # METRICS_DIR=auto: workers share a metrics directory of this master's
+    import metrics
+    metrics.start_server()
+
+
+def when_ready(server):
+    if preload_app:
+        import main
+        if main.WARMUP:
+            main.warm_up(connect=False)
+
+
+def post_worker_init(worker):
+    import main
+    if main.WARMUP:
+        main.warm_up()
@@ -0,0 +1,162 @@
+"""Single-pass intent parsing for story requests.
+
+One precompiled, trie-shaped regex finds every keyword in one scan, with
+word-boundary semantics (so "more" no longer matches inside "tomorrow"),
+and the matches are sorted into topic, voice style, continuation and
+interruption signals.
+"""
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+Intent = namedtuple('Intent', ['topic', 'voice_style', 'is_continuation', 'is_interruption'])
+
+# Leading phrases that introduce a request when LEADING_REQUEST doesn't match;
+# the topic is whatever follows
+STORY_TRIGGERS = [
+    "tell me a story",
+    "tell a story",
+    "story about",
+    "a story about",
+    "give me a story",
+    "can you tell me"
+]
+
+# "... a story about X" anywhere in the message: X is the topic
+ABOUT_TRIGGERS = ["a story about", "story about", "a tale about", "stories about", "tale about", "story of", "tale of"]
+
+# Checked in this order: the first style with any keyword wins
+STYLE_KEYWORDS = {
+    "mystery": ["scary", "creepy", "spooky", "mystery", "secret"],
+    "comedy": ["funny", "silly", "comedy", "joke", "laugh"],
+    "adventure": ["adventure", "action", "exciting", "thrilling", "quest"],
+    "storyteller": ["bedtime", "calm", "gentle", "soothing", "relaxing"]
+}
+
+CONTINUATION_PHRASES = ['continue', 'next', 'what happens', 'go on', 'more', 'and then']
+
+INTERRUPTION_PHRASES = ['wait', 'stop', 'actually', 'change it', 'make it', 'instead']
+
+# "tell me a (short) scary story", "give me an adventure story please", ...
+LEADING_REQUEST = re.compile(
+    r"^(?:(?:can|could|would|will) you |please )?(?:tell|give|read)(?: me| us)? "
+    r"(?:a|an|another|one more)? ?(?:[a-z'-]+ ){0,3}?(?:story|tale)\b\W*"
+)
+
+
+def trie_pattern(phrases):
+    """Regex alternation for phrases, factored into a character trie.
+
+    Python's re tries a flat alternation branch by branch at every position;
+    sharing prefixes means each position is rejected after a character or two.
+    Longer phrases are preferred over their prefixes ("a story about" over "a").
+    """
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        group = '(?:' + '|'.join(branches) + ')'
+        return group + '?' if '' in node else group
+
+    return build(trie)
+
+
+class IntentEngine:
+    """Keyword tables compiled into one word-bounded alternation.
+
+    Tables can be extended with ``add_keywords``; the pattern is rebuilt then.
+    """
+
+    def __init__(self):
+        # phrase -> list of (kind, value)
+        self._phrases = {}
+        self._style_order = []
+        for phrase in ABOUT_TRIGGERS:
+            self._add(phrase, 'about', phrase)
+        for style, words in STYLE_KEYWORDS.items():
+            self.add_keywords('style', words, style)
+        self.add_keywords('continuation', CONTINUATION_PHRASES)
+        self.add_keywords('interruption', INTERRUPTION_PHRASES)
+
+    def _add(self, phrase, kind, value):
+        self._phrases.setdefault(phrase.lower(), []).append((kind, value))
+        self._pattern = None
+
+    def add_keywords(self, kind, phrases, value=True):
+        """Register phrases for 'style' (value = style name), 'continuation' or 'interruption'"""
+        if kind == 'style' and value not in self._style_order:
+            self._style_order.append(value)
+        for phrase in phrases:
+            self._add(phrase, kind, value)
+
+    @property
+    def pattern(self):
+        if self._pattern is None:
+            self._pattern = re.compile(r"\b" + trie_pattern(self._phrases) + r"\b")
+        return self._pattern
+
+    def parse(self, text):
+        """Intent for a message; topic is '' and voice_style None when not stated"""
+        lowered = text.lower().strip()
+        styles = set()
+        is_continuation = is_interruption = False
+        topic_start = None
+
+        for phrase in self.pattern.findall(lowered):
+            for kind, value in self._phrases[phrase]:
+                if kind == 'style':
+                    styles.add(value)
+                elif kind == 'continuation':
+                    is_continuation = True
+                elif kind == 'interruption':
+                    is_interruption = True
+                elif kind == 'about' and topic_start is None:
+                    # Only topics need a position, so only they pay for a search
+                    topic_start = re.search(r"\b" + re.escape(phrase) + r"\b", lowered).end()
+
+        if topic_start is None:
+            leading = LEADING_REQUEST.match(lowered)
+            if leading:
+                topic_start = leading.end()
+            else:
+                trigger = next((t for t in STORY_TRIGGERS if lowered.startswith(t)), "")
+                topic_start = len(trigger)
+
+        voice_style = next((style for style in self._style_order if style in styles), None)
+        return Intent(clean_topic(lowered[topic_start:]), voice_style, is_continuation, is_interruption)
+
+
+# Words people wrap around a topic: "about ...", "... instead, please."
+LEADING_ARTIFACTS = ("about", "please")
+TRAILING_ARTIFACTS = ("please", "instead")
+
+
+def clean_topic(topic):
+    """Strip the artifacts people add around a topic"""
+    topic = topic.strip(" ,.!?")
+    changed = True
+    while changed and topic:
+        changed = False
+        head, _, rest = topic.partition(" ")
+        if head.rstrip(",") in LEADING_ARTIFACTS:
+            topic, changed = rest.strip(" ,"), True
+        rest, _, tail = topic.rpartition(" ")
+        if tail in TRAILING_ARTIFACTS:
+            topic, changed = rest.strip(" ,.!?"), True
+    return topic
+
+
+default_engine = IntentEngine()
+
+
+@lru_cache(maxsize=1024)
+def parse_intent(text):
+    """Parse with the default engine; cached, since one request asks more than once"""
+    return default_engine.parse(text)
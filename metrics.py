@@ -0,0 +1,255 @@
+"""Low-overhead counters, gauges and histograms with Prometheus text output.
+
+Each process records into plain dicts under one lock. With a ``directory``
+every process also writes its snapshot there every few seconds (and at
+exit), and ``render`` sums those of its server, so a scrape that lands on any
+gunicorn worker reports the whole server. Snapshots left by another server
+that has since exited are deleted. Gauges are kept per worker and only shown
+for workers that are still alive.
+"""
+import atexit
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+# Seconds; covers a sub-millisecond parse up to a slow Gemini call
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+# Set by gunicorn.conf.py to the master's pid, which its workers inherit
+SERVER_ENV = "METRICS_SERVER"
+DIRECTORY_PREFIX = "talespin-metrics-"
+
+
+def server_pid():
+    """Pid of the server this process belongs to: the gunicorn master, else the parent"""
+    return int(os.environ.get(SERVER_ENV) or os.getppid())
+
+
+def default_directory():
+    """Snapshot directory of this gunicorn server, or None outside gunicorn"""
+    if not os.environ.get(SERVER_ENV):
+        return None
+    return os.path.join(tempfile.gettempdir(), f"{DIRECTORY_PREFIX}{os.environ[SERVER_ENV]}")
+
+
+def start_server():
+    """Called by the gunicorn master before forking: make "auto" directories its own.
+
+    Clears what an earlier master with the same pid left behind and removes
+    the directories of masters that have exited.
+    """
+    os.environ[SERVER_ENV] = str(os.getpid())
+    shutil.rmtree(default_directory(), ignore_errors=True)
+    for name in os.listdir(tempfile.gettempdir()):
+        pid = name[len(DIRECTORY_PREFIX):]
+        if name.startswith(DIRECTORY_PREFIX) and pid.isdigit() and not pid_alive(int(pid)):
+            shutil.rmtree(os.path.join(tempfile.gettempdir(), name), ignore_errors=True)
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                     for key, value in labels)
+    return "{" + pairs + "}"
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """Metric registry; labels are passed as keyword arguments.
+
+    ``directory`` may be "auto" (shared under gunicorn, per process otherwise;
+    see default_directory, resolved in each process) or None to keep metrics
+    per process.
+    """
+
+    def __init__(self, directory=None, flush_interval=5.0):
+        self.directory = directory
+        self._directory = None
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._help = {}
+        self._pid = None
+
+    def describe(self, name, kind, text):
+        self._help[name] = (kind, text)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self._started()
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self._started()
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self._started()
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0]
+            index = 0
+            while index < len(BUCKETS) and seconds > BUCKETS[index]:
+                index += 1
+            histogram[0][index] += 1
+            histogram[1] += seconds
+
+    def timer(self, name, **labels):
+        """Context manager observing the time spent in its block"""
+        return _Timer(self, name, labels)
+
+    # Sharing between worker processes
+
+    def _started(self):
+        """Start the flush thread once per process (so forked workers get their own)"""
+        if self._pid == os.getpid() or not self.directory:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            # Anything inherited from the parent was the parent's to report
+            self._counters, self._gauges, self._histograms = {}, {}, {}
+            self._directory = default_directory() if self.directory == "auto" else self.directory
+        if not self._directory:
+            return
+        os.makedirs(self._directory, exist_ok=True)
+        threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True).start()
+        atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Metrics flush error: {e}")
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "server": server_pid(),
+                "counters": [[name, labels, value] for (name, labels), value in self._counters.items()],
+                "gauges": [[name, labels, value] for (name, labels), value in self._gauges.items()],
+                "histograms": [[name, labels, counts, total]
+                               for (name, labels), (counts, total) in self._histograms.items()],
+            }
+
+    def flush(self):
+        """Write this process's snapshot for the other workers to read"""
+        if not self._directory or self._pid != os.getpid():
+            return
+        path = os.path.join(self._directory, f"{os.getpid()}.json")
+        temporary = path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temporary, path)
+
+    def _snapshots(self):
+        own = self.snapshot()
+        snapshots = [own]
+        if not self._directory or self._pid != os.getpid():
+            return snapshots
+        for filename in os.listdir(self._directory):
+            if not filename.endswith(".json") or filename == f"{own['pid']}.json":
+                continue
+            path = os.path.join(self._directory, filename)
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            server = snapshot.get("server")
+            if server == own["server"]:
+                snapshots.append(snapshot)
+            elif server is None or not pid_alive(server):
+                # Left by a server that has exited: nobody will report it again
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        return snapshots
+
+    def render(self):
+        """Prometheus text exposition of every worker's metrics combined"""
+        counters, gauges, histograms = {}, {}, {}
+        for snapshot in self._snapshots():
+            alive = snapshot["pid"] == os.getpid() or pid_alive(snapshot["pid"])
+            for name, labels, value in snapshot["counters"]:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                counters[key] = counters.get(key, 0) + value
+            if alive:
+                for name, labels, value in snapshot["gauges"]:
+                    labels = tuple(tuple(pair) for pair in labels) + (("worker", snapshot["pid"]),)
+                    gauges[(name, labels)] = value
+            for name, labels, counts, total in snapshot["histograms"]:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                merged = histograms.setdefault(key, [[0] * len(counts), 0.0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+
+        lines = []
+        for kind, series in (("counter", counters), ("gauge", gauges), ("histogram", histograms)):
+            for name in sorted({name for name, _ in series}):
+                _, text = self._help.get(name, (kind, name))
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for (series_name, labels), value in sorted(series.items(), key=lambda item: str(item[0])):
+                    if series_name != name:
+                        continue
+                    if kind != "histogram":
+                        lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+                        continue
+                    counts, total = value
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS + (math.inf,), counts):
+                        cumulative += count
+                        bucket_labels = labels + (("le", format_value(bound)),)
+                        lines.append(f"{name}_bucket{format_labels(bucket_labels)} {cumulative}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {format_value(total)}")
+                    lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+class _Timer:
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.started, **self.labels)
+        return False
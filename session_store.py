@@ -0,0 +1,448 @@
+"""Session stores for story continuity.
+
+All backends share one small interface so the app doesn't care where sessions
+live:
+
+- ``memory://``            in-process dict (single worker only)
+- ``sqlite:///path/to.db`` shared by every worker on one host
+- ``redis://host:port/db`` shared across hosts (speaks RESP directly, no client library)
+
+Reads return a snapshot; writes go through ``set`` or ``update``, and
+``update`` is an atomic read-modify-write on every backend. Sessions expire
+``ttl`` seconds after they were last touched.
+"""
+import json
+import random
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+# Payloads bigger than this are deflated before they're stored
+COMPRESS_THRESHOLD = 512
+
+
+def encode_session(data):
+    """Compact JSON, deflated when it's worth it; first byte says which"""
+    raw = json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    if len(raw) > COMPRESS_THRESHOLD:
+        return b'z' + zlib.compress(raw)
+    return b'j' + raw
+
+
+def decode_session(blob):
+    if blob is None:
+        return None
+    blob = bytes(blob)
+    if blob[:1] == b'z':
+        return json.loads(zlib.decompress(blob[1:]))
+    return json.loads(blob[1:])
+
+
+class SessionStore:
+    """Interface every backend implements"""
+
+    ttl = 3600
+
+    def get(self, session_id):
+        """Snapshot of the session, or None"""
+        raise NotImplementedError
+
+    def set(self, session_id, data):
+        raise NotImplementedError
+
+    def update(self, session_id, mutate):
+        """Atomically apply ``mutate(data_or_None) -> data`` and store the result.
+
+        If ``mutate`` returns None nothing is written.
+        """
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        raise NotImplementedError
+
+    def expire(self):
+        """Drop sessions idle for longer than ``ttl``; returns how many"""
+        raise NotImplementedError
+
+    def stats(self):
+        """Size and eviction counters, for sizing the caps"""
+        return {"sessions": len(self)}
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def __contains__(self, session_id):
+        return self.get(session_id) is not None
+
+
+class MemorySessionStore(SessionStore):
+    """The original module-level dict, behind a lock, with TTL and LRU caps.
+
+    Entries are kept in last-access order. With one TTL for every session that
+    order is also the expiry order, so expiring and LRU eviction both just pop
+    from the front: O(1) per session, done incrementally on every access rather
+    than by scanning the whole store.
+    """
+
+    def __init__(self, ttl=3600, max_sessions=None, max_bytes=None):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        # session id -> (last access, encoded payload), least recently used first
+        self._sessions = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.counters = {"expired": 0, "evicted": 0}
+
+    def _store(self, session_id, blob, now):
+        old = self._sessions.pop(session_id, None)
+        if old:
+            self._bytes -= len(old[1]) + len(session_id)
+        self._sessions[session_id] = (now, blob)
+        self._bytes += len(blob) + len(session_id)
+        self._evict(now)
+
+    def _drop_oldest(self):
+        session_id, (_, blob) = self._sessions.popitem(last=False)
+        self._bytes -= len(blob) + len(session_id)
+
+    def _evict(self, now):
+        """Expire idle sessions from the front, then enforce the caps (LRU)"""
+        expired = 0
+        while self._sessions:
+            accessed, _ = next(iter(self._sessions.values()))
+            if accessed + self.ttl > now:
+                break
+            self._drop_oldest()
+            expired += 1
+        self.counters["expired"] += expired
+
+        while self._sessions and (
+                (self.max_sessions and len(self._sessions) > self.max_sessions) or
+                (self.max_bytes and self._bytes > self.max_bytes)):
+            self._drop_oldest()
+            self.counters["evicted"] += 1
+        return expired
+
+    def get(self, session_id):
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            entry = self._sessions.get(session_id)
+            if not entry:
+                return None
+            self._sessions[session_id] = (now, entry[1])
+            self._sessions.move_to_end(session_id)
+        return decode_session(entry[1])
+
+    def set(self, session_id, data):
+        blob = encode_session(data)
+        with self._lock:
+            self._store(session_id, blob, time.time())
+
+    def update(self, session_id, mutate):
+        with self._lock:
+            now = time.time()
+            self._evict(now)
+            entry = self._sessions.get(session_id)
+            data = mutate(decode_session(entry[1]) if entry else None)
+            if data is not None:
+                self._store(session_id, encode_session(data), now)
+        return data
+
+    def delete(self, session_id):
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            if entry:
+                self._bytes -= len(entry[1]) + len(session_id)
+
+    def expire(self):
+        with self._lock:
+            return self._evict(time.time())
+
+    def stats(self):
+        with self._lock:
+            return {"sessions": len(self._sessions), "bytes": self._bytes,
+                    "max_sessions": self.max_sessions, "max_bytes": self.max_bytes,
+                    **self.counters}
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions in a SQLite file, shared by all workers on the host.
+
+    ``accessed`` is indexed, so expiring is a range delete rather than a scan.
+    """
+
+    def __init__(self, path, ttl=3600):
+        self.path = path
+        self.ttl = ttl
+        self.counters = {"expired": 0}
+        self._local = threading.local()
+        # Not kept for this thread: with gunicorn's preload_app this runs in the
+        # master, and a SQLite connection must not be carried across a fork
+        db = self._open()
+        db.execute("""CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            data BLOB NOT NULL,
+            accessed REAL NOT NULL
+        )""")
+        db.execute("CREATE INDEX IF NOT EXISTS sessions_accessed ON sessions (accessed)")
+        db.close()
+
+    def _open(self):
+        # isolation_level=None: transactions are explicit (BEGIN IMMEDIATE below)
+        db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def _connection(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = self._open()
+        return db
+
+    def _read(self, db, session_id):
+        # Expired rows may linger until the next expire(); never hand them out
+        row = db.execute("SELECT data FROM sessions WHERE id = ? AND accessed > ?",
+                         (session_id, time.time() - self.ttl)).fetchone()
+        return decode_session(row[0]) if row else None
+
+    def get(self, session_id):
+        return self._read(self._connection(), session_id)
+
+    def set(self, session_id, data):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO sessions (id, data, accessed) VALUES (?, ?, ?)",
+            (session_id, encode_session(data), time.time()))
+
+    def update(self, session_id, mutate):
+        db = self._connection()
+        # BEGIN IMMEDIATE takes the write lock up front, so no other worker
+        # can slip a write in between our read and our write
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            data = mutate(self._read(db, session_id))
+            if data is not None:
+                db.execute("INSERT OR REPLACE INTO sessions (id, data, accessed) VALUES (?, ?, ?)",
+                           (session_id, encode_session(data), time.time()))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return data
+
+    def delete(self, session_id):
+        self._connection().execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def expire(self):
+        cursor = self._connection().execute(
+            "DELETE FROM sessions WHERE accessed <= ?", (time.time() - self.ttl,))
+        self.counters["expired"] += cursor.rowcount
+        return cursor.rowcount
+
+    def stats(self):
+        return {"sessions": len(self), **self.counters}
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisConnectionError(RedisError):
+    pass
+
+
+class RedisConnection:
+    """Just enough of the Redis protocol (RESP2) for the session store"""
+
+    def __init__(self, host, port, db=0, password=None, timeout=5):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+        if password:
+            self.execute('AUTH', password)
+        if db:
+            self.execute('SELECT', db)
+
+    def execute(self, *args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        self.sock.sendall(b''.join(parts))
+        return self._read_reply()
+
+    def _read_reply(self):
+        line = self.reader.readline()
+        if not line:
+            raise RedisConnectionError("connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode()
+        if kind == b'-':
+            raise RedisError(rest.decode())
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            return self.reader.read(length + 2)[:-2]
+        if kind == b'*':
+            length = int(rest)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise RedisError(f"unexpected reply: {line!r}")
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+
+class RedisSessionStore(SessionStore):
+    """Sessions in Redis: one key per session plus a sorted-set index by last access.
+
+    Redis expires the keys itself (EX is reset on every write); expire() only
+    trims the index so the session count stays right.
+    """
+
+    def __init__(self, host='127.0.0.1', port=6379, db=0, password=None,
+                 prefix='talespin:session:', ttl=3600):
+        self.address = (host, port, db, password)
+        self.prefix = prefix
+        self.index = prefix + 'index'
+        self.ttl = ttl
+        self.counters = {"expired": 0}
+        self._local = threading.local()
+
+    def _redis(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = RedisConnection(*self.address)
+            self._local.conn = conn
+        return conn
+
+    def _drop(self):
+        conn, self._local.conn = getattr(self._local, 'conn', None), None
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    def _reconnecting(self, work):
+        """work(conn) on this thread's connection, once more on a new one if it was dropped"""
+        try:
+            return work(self._redis())
+        except (OSError, RedisConnectionError):
+            self._drop()
+            return work(self._redis())
+
+    def _execute(self, *args):
+        return self._reconnecting(lambda conn: conn.execute(*args))
+
+    def _write(self, session_id, data):
+        """Commands that store a session (run inside MULTI)"""
+        return [
+            ('SET', self.prefix + session_id, encode_session(data), 'EX', int(self.ttl)),
+            ('ZADD', self.index, time.time(), session_id),
+        ]
+
+    def get(self, session_id):
+        return decode_session(self._execute('GET', self.prefix + session_id))
+
+    def set(self, session_id, data):
+        self._transaction(self._write(session_id, data))
+
+    def _transaction(self, commands):
+        return self._reconnecting(lambda conn: self._multi(conn, commands))
+
+    def _multi(self, conn, commands):
+        """MULTI/EXEC on conn; returns None if a WATCHed key changed"""
+        conn.execute('MULTI')
+        try:
+            for command in commands:
+                conn.execute(*command)
+        except (OSError, RedisConnectionError):
+            # Nothing to DISCARD on a dead connection
+            raise
+        except BaseException:
+            conn.execute('DISCARD')
+            raise
+        return conn.execute('EXEC')
+
+    def _try_update(self, conn, session_id, mutate):
+        """One WATCH/GET/MULTI round; (committed, data)"""
+        key = self.prefix + session_id
+        conn.execute('WATCH', key)
+        try:
+            data = mutate(decode_session(conn.execute('GET', key)))
+        except BaseException:
+            conn.execute('UNWATCH')
+            raise
+        if data is None:
+            conn.execute('UNWATCH')
+            return True, None
+        return self._multi(conn, self._write(session_id, data)) is not None, data
+
+    def update(self, session_id, mutate):
+        # Optimistic locking: retry if another worker wrote the session meanwhile.
+        # A dropped connection reruns the round (WATCH and all) on a new one.
+        for attempt in range(50):
+            if attempt:
+                time.sleep(random.uniform(0, 0.001 * attempt))
+            committed, data = self._reconnecting(lambda conn: self._try_update(conn, session_id, mutate))
+            if committed:
+                return data
+        raise RedisError(f"too much contention updating session {session_id}")
+
+    def delete(self, session_id):
+        self._transaction([('DEL', self.prefix + session_id),
+                           ('ZREM', self.index, session_id)])
+
+    def expire(self):
+        cutoff = time.time() - self.ttl
+        expired = self._execute('ZRANGEBYSCORE', self.index, '-inf', cutoff)
+        if expired:
+            self._transaction([('DEL', *[self.prefix + sid.decode() for sid in expired]),
+                               ('ZREM', self.index, *expired)])
+        self.counters["expired"] += len(expired or [])
+        return len(expired or [])
+
+    def stats(self):
+        return {"sessions": len(self), **self.counters}
+
+    def __len__(self):
+        return self._execute('ZCARD', self.index)
+
+
+def create_session_store(url='memory://', ttl=3600, max_sessions=None, max_bytes=None):
+    """Build a session store from a SESSION_STORE_URL-style string.
+
+    The caps only apply to the in-process store; SQLite and Redis are bounded
+    by the TTL (and Redis by its own maxmemory policy).
+    """
+    parsed = urlparse(url)
+    if parsed.scheme in ('', 'memory'):
+        return MemorySessionStore(ttl, max_sessions, max_bytes)
+    if parsed.scheme == 'sqlite':
+        # sqlite:///relative.db or sqlite:////absolute/path.db
+        return SQLiteSessionStore(parsed.path[1:] or 'sessions.db', ttl)
+    if parsed.scheme == 'redis':
+        db = int(parsed.path[1:] or 0)
+        return RedisSessionStore(parsed.hostname or '127.0.0.1', parsed.port or 6379,
+                                 db=db, password=parsed.password, ttl=ttl)
+    raise ValueError(f"Unknown session store: {url}")
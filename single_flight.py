@@ -0,0 +1,260 @@
+"""Coalescing of identical in-flight generations ("single flight")"""
+import threading
+import time
+
+from cancellation import CancelToken
+
+
+class Flight:
+    """One in-flight generation that any number of waiters can follow.
+
+    Streaming leaders publish text as it arrives; followers can either wait
+    for the final result or replay the published text and keep following it.
+    The generation runs under the flight's own ``cancel`` token, which fires
+    only once every waiter has left, so no one waiter can abort it for the rest.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.chunks = []
+        self.done = False
+        self.result = None
+        self.error = None
+        self.cancel = CancelToken()
+        # The leader and followers still on the flight (see SingleFlight.join)
+        self.waiters = 1
+
+    def publish(self, chunk):
+        with self._cond:
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+
+    def finish(self, result):
+        with self._cond:
+            self.done = True
+            self.result = result
+            self._cond.notify_all()
+
+    def fail(self, error):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def wait(self, timeout=None, cancel=None):
+        """Final result; raises the leader's error, or TimeoutError. None once ``cancel`` fires."""
+        remove = cancel.on_cancel(self._wake) if cancel is not None else None
+        try:
+            with self._cond:
+                if not self._cond.wait_for(lambda: self.done or (cancel is not None and cancel.cancelled), timeout):
+                    raise TimeoutError("gave up waiting on coalesced generation")
+                if not self.done:
+                    return None
+                if self.error:
+                    raise self.error
+                return self.result
+        finally:
+            if remove:
+                remove()
+
+    def stream(self, timeout=None, cancel=None):
+        """Yield published chunks from the start, then live, until the flight ends or ``cancel`` fires.
+
+        A flight whose leader doesn't stream yields its result as one chunk.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        remove = cancel.on_cancel(self._wake) if cancel is not None else None
+        sent = 0
+        try:
+            while True:
+                with self._cond:
+                    remaining = None if deadline is None else max(0, deadline - time.monotonic())
+                    if not self._cond.wait_for(lambda: self.done or len(self.chunks) > sent or
+                                               (cancel is not None and cancel.cancelled), remaining):
+                        raise TimeoutError("gave up waiting on coalesced generation")
+                    new = self.chunks[sent:]
+                    finished = self.done
+                    error, result = self.error, self.result
+                if cancel is not None and cancel.cancelled:
+                    return
+                sent += len(new)
+                yield from new
+
+                if finished:
+                    if error:
+                        raise error
+                    if not sent and result:
+                        yield result
+                    return
+        finally:
+            if remove:
+                remove()
+
+
+class SingleFlight:
+    """Only one generation runs per key; everyone else with that key follows it"""
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.counters = {"leaders": 0, "followers": 0, "timeouts": 0, "failures": 0,
+                         "abandoned": 0, "drained": 0}
+
+    def join(self, key):
+        """(flight, is_leader): the leader must run the work, via run() or lead().
+
+        Leader and followers each count as a waiter on the flight until they
+        leave it (run(), lead() and follow_stream() see to that).
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                self.counters["followers"] += 1
+                return flight, False
+            flight = self._flights[key] = Flight()
+            self.counters["leaders"] += 1
+            return flight, True
+
+    def _remove(self, key, flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def _leave(self, key, flight):
+        """One waiter fewer; the last one out cancels a generation that's still running"""
+        with self._lock:
+            flight.waiters -= 1
+            abandoned = flight.waiters <= 0 and not flight.done
+            if abandoned:
+                self.counters["abandoned"] += 1
+                # Later requests for the key start afresh rather than join a cancelled call
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+        if abandoned:
+            flight.cancel.cancel("abandoned")
+
+    def _waiter(self, key, flight, cancel):
+        """leave() for one waiter, also run as soon as its ``cancel`` fires; only the first call counts"""
+        once = threading.Lock()
+
+        def leave():
+            if once.acquire(blocking=False):
+                self._leave(key, flight)
+
+        unlink = cancel.on_cancel(leave) if cancel is not None else None
+
+        def done():
+            if unlink:
+                unlink()
+            leave()
+        return done
+
+    def _fail(self, key, flight, error):
+        self._remove(key, flight)
+        with self._lock:
+            self.counters["failures"] += 1
+        flight.fail(error)
+
+    def _finish(self, key, flight, result):
+        self._remove(key, flight)
+        flight.finish(result)
+
+    def run(self, key, fn, timeout=None, cancel=None):
+        """Call fn(flight_cancel) once per key; concurrent callers get its result or its error.
+
+        fn must stop on the token it's given, the flight's, not on the leader's
+        ``cancel``: the generation is only cancelled once every caller has been.
+        A caller cancelled before then gets None straight away, unless it is
+        the leader, which runs fn to the end for the others. ``timeout`` bounds
+        how long a follower waits (TimeoutError after that).
+        """
+        flight, leader = self.join(key)
+        done = self._waiter(key, flight, cancel)
+        try:
+            if not leader:
+                return self.follow(flight, timeout, cancel)
+            try:
+                result = fn(flight.cancel)
+            except Exception as e:
+                self._fail(key, flight, e)
+                raise
+            self._finish(key, flight, result)
+            return result
+        finally:
+            done()
+
+    def follow(self, flight, timeout=None, cancel=None):
+        try:
+            return flight.wait(timeout, cancel)
+        except TimeoutError:
+            with self._lock:
+                self.counters["timeouts"] += 1
+            raise
+
+    def follow_stream(self, key, flight, timeout=None, cancel=None):
+        """A joined follower's chunks (see Flight.stream); leaves the flight when closed"""
+        done = self._waiter(key, flight, cancel)
+        try:
+            yield from flight.stream(timeout, cancel)
+        except TimeoutError:
+            with self._lock:
+                self.counters["timeouts"] += 1
+            raise
+        finally:
+            done()
+
+    def lead(self, key, flight, chunks, cancel=None):
+        """Pass a leader's streamed chunks through, publishing them to followers.
+
+        ``chunks`` must be generated under ``flight.cancel``. The joined text
+        is the flight's result; if the stream raises, followers get the error.
+        If the leader stops early (its client left, or ``cancel`` fired) while
+        followers remain, the rest of the stream is read for them on a thread
+        of its own; if none remain, the stream is cancelled.
+        """
+        done = self._waiter(key, flight, cancel)
+        parts = []
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                flight.publish(chunk)
+                yield chunk
+        except GeneratorExit:
+            done()
+            if flight.cancel.cancelled:
+                chunks.close()
+                self._fail(key, flight, RuntimeError("stream abandoned by every waiter"))
+            else:
+                threading.Thread(target=self._drain, args=(key, flight, chunks, parts),
+                                 name="flight-drain", daemon=True).start()
+            raise
+        except Exception as e:
+            done()
+            self._fail(key, flight, e)
+            raise
+        done()
+        self._finish(key, flight, ''.join(parts) or None)
+
+    def _drain(self, key, flight, chunks, parts):
+        """Read the rest of a stream its leader left, for the followers still on it"""
+        with self._lock:
+            self.counters["drained"] += 1
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                flight.publish(chunk)
+        except Exception as e:
+            self._fail(key, flight, e)
+            return
+        finally:
+            chunks.close()
+        self._finish(key, flight, ''.join(parts) or None)
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._flights), **self.counters}
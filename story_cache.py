@@ -0,0 +1,139 @@
+"""Generated-story cache keyed on normalized request, with rotating variants, and a pool of surplus stories"""
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class StoryCache:
+    """LRU + TTL cache holding several story variants per key.
+
+    A key only starts serving hits once it holds ``variants`` stories, so
+    repeated prompts rotate through different stories instead of replaying
+    one. Until then every lookup is a miss and the caller adds what it
+    generated.
+    """
+
+    def __init__(self, max_entries=1000, ttl=3600, variants=3):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.variants = variants
+        # key -> {"created": t, "stories": [...], "next": i}, least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "evicted": 0}
+
+    def _entry(self, key, now):
+        entry = self._entries.get(key)
+        if entry and entry["created"] + self.ttl <= now:
+            del self._entries[key]
+            entry = None
+        return entry
+
+    def get(self, key):
+        """A cached story for the key, or None (counted as a miss)"""
+        with self._lock:
+            entry = self._entry(key, time.time())
+            if not entry or len(entry["stories"]) < self.variants:
+                self.counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            story = entry["stories"][entry["next"] % len(entry["stories"])]
+            entry["next"] += 1
+            self.counters["hits"] += 1
+            return story
+
+    def add(self, key, story):
+        with self._lock:
+            now = time.time()
+            entry = self._entry(key, now)
+            if entry is None:
+                entry = self._entries[key] = {"created": now, "stories": [], "next": 0}
+            self._entries.move_to_end(key)
+            if len(entry["stories"]) < self.variants:
+                entry["stories"].append(story)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters["evicted"] += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                **self.counters,
+                "hit_rate": round(self.counters["hits"] / lookups, 3) if lookups else 0.0
+            }
+
+
+class SurplusPool:
+    """Stories generated but never served (extra candidates), each handed out once.
+
+    Up to ``per_key`` stories wait under each of at most ``max_entries`` keys,
+    least recently used keys dropped first, and a story is discarded once
+    it's ``ttl`` seconds old. Unlike StoryCache nothing is replayed: a story
+    taken leaves the pool.
+    """
+
+    def __init__(self, max_entries=1000, per_key=4, ttl=3600):
+        self.max_entries = max_entries
+        self.per_key = per_key
+        self.ttl = ttl
+        # key -> deque of (added, story), oldest first; least recently used key first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"added": 0, "dropped": 0, "expired": 0, "evicted": 0, "hits": 0, "misses": 0}
+
+    def _stories(self, key, now):
+        stories = self._entries.get(key)
+        while stories and stories[0][0] + self.ttl <= now:
+            stories.popleft()
+            self.counters["expired"] += 1
+        if stories is not None and not stories:
+            del self._entries[key]
+            return None
+        return stories
+
+    def take(self, key):
+        """A pooled story for the key, removed from the pool, or None (counted as a miss)"""
+        with self._lock:
+            stories = self._stories(key, time.time())
+            if not stories:
+                self.counters["misses"] += 1
+                return None
+            self.counters["hits"] += 1
+            story = stories.popleft()[1]
+            if not stories:
+                del self._entries[key]
+            return story
+
+    def add(self, key, stories):
+        """Pool ``stories`` under the key as far as there's room; returns how many were kept"""
+        with self._lock:
+            now = time.time()
+            entry = self._stories(key, now)
+            if entry is None:
+                entry = self._entries[key] = deque()
+            self._entries.move_to_end(key)
+            kept = stories[:max(0, self.per_key - len(entry))]
+            entry.extend((now, story) for story in kept)
+            self.counters["added"] += len(kept)
+            self.counters["dropped"] += len(stories) - len(kept)
+
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.counters["evicted"] += len(evicted)
+            return len(kept)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                "keys": len(self._entries),
+                "stories": sum(len(stories) for stories in self._entries.values()),
+                "max_entries": self.max_entries,
+                "per_key": self.per_key,
+                **self.counters,
+                "hit_rate": round(self.counters["hits"] / lookups, 3) if lookups else 0.0
+            }
@@ -0,0 +1,420 @@
+"""Offline story engine: full-length stories from phrase banks, no network.
+
+Stories follow the five beats build_voice_optimized_prompt asks Gemini for:
+a hook, the protagonist, a challenge, a turning point and an ending left open
+for continuation. Each style has its own bank of sentence templates per beat
+plus the places, characters and objects they are filled with.
+"""
+import random
+
+# Beats in order, with each one's share of the words
+BEATS = (("hook", 0.15), ("protagonist", 0.2), ("challenge", 0.25), ("turn", 0.25), ("ending", 0.15))
+CONTINUATION_BEATS = (("twist", 0.35), ("turn_continued", 0.4), ("close", 0.25))
+
+# (name, object pronoun, possessive); names are always the subject, so verbs agree
+HEROES = [
+    ("Wren", "her", "her"), ("Tobias", "him", "his"), ("Juniper", "her", "her"),
+    ("Milo", "him", "his"), ("Ada", "her", "her"), ("Felix", "him", "his"),
+    ("Rosalind", "her", "her"), ("Oskar", "him", "his"), ("Poppy", "her", "her"),
+    ("Theo", "him", "his"), ("River", "them", "their"), ("Sam", "them", "their"),
+]
+
+BANKS = {
+    "storyteller": {
+        "places": [
+            "a village at the edge of a silver lake",
+            "a town where the lamplighters still walked the streets",
+            "a cottage at the bottom of a very old hill",
+            "a harbour town where the boats sang in the wind",
+            "a valley so quiet you could hear the moon rise",
+            "a little house between two enormous oak trees",
+        ],
+        "roles": [
+            "a baker's apprentice", "a lighthouse keeper's child",
+            "a clockmaker who mended things nobody else could", "a shepherd with a fondness for maps",
+            "a librarian's helper", "a gardener who talked to the roses",
+        ],
+        "companions": [
+            "a one-eared cat named Biscuit", "an old dog with a grey muzzle", "a small brown owl",
+            "a hedgehog who liked pockets", "a patient grey donkey", "a fox cub with a crooked tail",
+        ],
+        "objects": [
+            "a lantern that never quite went out", "a silver key no bigger than a fingernail",
+            "a music box that played a tune nobody knew", "a map drawn in fading blue ink",
+            "a smooth stone that was always warm", "a feather that glowed like a candle",
+        ],
+        "hook": [
+            "Once, in {place}, there was a story about {topic}, and tonight it is yours to keep.",
+            "Long ago, when the nights were longer and the stars sat lower in the sky, people still whispered about {topic}.",
+            "Settle in and get comfortable, because this is the tale of {topic}, and it begins the way the best tales do: quietly.",
+            "Nobody who lived there ever expected {topic} to change anything, least of all on an ordinary autumn evening.",
+            "There is a special kind of hush that falls just before something wonderful happens, and on this night the hush was all about {topic}.",
+        ],
+        "protagonist": [
+            "{hero} was {role}, with pockets full of odds and ends and a heart that noticed small things.",
+            "Of everyone for miles around, it was {hero} who paid the closest attention to the world.",
+            "{hero} had always been told that {pos} curiosity would lead somewhere, though nobody ever said exactly where.",
+            "Every evening, {hero} walked the long way home with {companion}, counting lanterns and making quiet wishes.",
+            "People said {hero} was far too gentle for adventures, but people are very often wrong about such things.",
+            "More than anything, {hero} wanted to find out whether the old stories were true.",
+        ],
+        "challenge": [
+            "Then one night, {object} appeared on the windowsill, humming softly, as if it had been waiting for {obj} all along.",
+            "But {topic} came with a question, and the question was a simple one: would {hero} be brave enough to follow it?",
+            "The trouble was that the magic only answered someone willing to give something up, and {hero} had very little to give.",
+            "Before long, {hero} had to choose between the safe road home and the narrow path that wandered off into the dark.",
+            "A cold wind swept through {place}, and with it came the feeling that something precious might soon be lost.",
+            "Even {companion} seemed uneasy, pressing close and refusing to go another step alone.",
+        ],
+        "turn": [
+            "So {hero} took a deep breath, stayed close to {companion}, and stepped forward into the unknown.",
+            "At the very edge of everything, {hero} finally understood that {topic} had never really been about magic at all, but about kindness.",
+            "With trembling hands, {hero} lifted {object}, and for one long moment the whole world seemed to glow from the inside out.",
+            "It was not a loud moment, or even a grand one, but it was the moment everything changed.",
+            "{hero} whispered a single word into the dark, and, very softly, the night whispered back.",
+            "And when the path finally opened, it led somewhere nobody had ever thought to look: right back home.",
+        ],
+        "ending": [
+            "By morning, everything looked almost the same as before, only a little brighter and a great deal more full of wonder.",
+            "{hero} smiled, because somewhere out there {topic} was still waiting, with another chapter tucked safely beneath its wing.",
+            "That night, {hero} fell asleep with {object} safe beside {obj}, dreaming about where it might lead next.",
+            "But what happened after that, as the oldest storytellers like to say, is a tale for another night.",
+            "And if you listen very closely as you drift off to sleep, you might just hear it calling to you, too.",
+        ],
+        "twist": [
+            "The next morning began like any other, with warm bread on the table and a slow, golden sunrise.",
+            "But before long, a small and curious thing happened that nobody could quite explain.",
+            "A letter arrived with no name on the envelope, only a drawing of {object}.",
+            "Down by the water, the old boats had started whispering to one another again.",
+        ],
+        "turn_continued": [
+            "Without a word, everyone knew that somebody had to go and see.",
+            "The path wound further than it ever had before, past the very last lamp and into the soft, friendly dark.",
+            "And waiting there, as if it had always been waiting, was the answer to a question nobody had thought to ask.",
+            "It was gentle, and strange, and just a little bit magical, the way the best surprises are.",
+        ],
+        "close": [
+            "By the time they wandered home, the stars were out, every single one of them.",
+            "And somewhere far away, the next part of the story was already beginning to stir.",
+            "But that is a tale for another night, when the candles are low and the blankets are warm.",
+            "So close your eyes for now, and keep a little room in your dreams for what comes next.",
+        ],
+    },
+    "adventure": {
+        "places": [
+            "the jagged cliffs of the Ember Coast", "a city built on the backs of sleeping giants",
+            "the frozen peaks beyond the Northern Gate", "a jungle where the rivers ran uphill",
+            "a sky harbour floating above the clouds", "the canyon everyone called the Devil's Staircase",
+        ],
+        "roles": [
+            "a courier who had never missed a delivery", "a young pilot with more nerve than sense",
+            "a map thief turned honest", "the fastest climber in three kingdoms",
+            "a ship's cook who dreamed of being captain", "an apprentice explorer on a first real mission",
+        ],
+        "companions": [
+            "a grumpy parrot who knew too much", "a battered robot with one working arm",
+            "a loyal wolfhound named Comet", "a sharp-eyed navigator called Bex",
+            "a tiny dragon the size of a teacup", "a stubborn mountain goat named Pickaxe",
+        ],
+        "objects": [
+            "a compass that pointed toward danger", "a cracked crystal that hummed near treasure",
+            "a map that redrew itself every hour", "a rusty key stamped with a skull",
+            "a glowing stone from the bottom of the sea", "a clockwork beetle that could open any lock",
+        ],
+        "hook": [
+            "It started with an explosion.",
+            "Alarm bells rang out across {place} just after midnight.",
+            "Everyone had heard the rumours about {topic}.",
+            "Nobody had ever come back from chasing {topic}.",
+            "This is the story of {topic}, and it moves fast, so hold on tight.",
+            "The sky turned a strange, crackling shade of green.",
+            "Somewhere out there, the secret of {topic} was waiting to be found.",
+            "The message had just three words scrawled across it: find it first.",
+        ],
+        "protagonist": [
+            "{hero} was {role}.",
+            "{hero} grabbed {pos} pack and ran for the door.",
+            "Fear had never stopped {hero} before.",
+            "{hero} had exactly one rule: never look down.",
+            "Right there alongside, as always, was {companion}.",
+            "{hero} checked the straps, tightened the boots and grinned.",
+            "This was the moment {hero} had been training for.",
+            "There was no time to think, only time to move.",
+        ],
+        "challenge": [
+            "Then the ground began to shake.",
+            "Behind them, the bridge collapsed into the gorge with a roar.",
+            "Rival hunters were closing in, and they were not friendly.",
+            "The only way forward was straight through {place}.",
+            "{object} flickered once, then pointed the wrong way entirely.",
+            "A storm tore across the horizon, black and furious.",
+            "They had until sunrise, and sunrise was coming fast.",
+            "One wrong step would send everything tumbling into the dark.",
+        ],
+        "turn": [
+            "{hero} jumped.",
+            "For a heartbeat, there was nothing below but wind.",
+            "Then {pos} fingers caught the edge, and {hero} hauled upward with everything left.",
+            "{companion} shouted a warning just in time.",
+            "With one last desperate push, {hero} held up {object}.",
+            "The air split open with blinding light.",
+            "And suddenly, there it was: the secret of {topic}, right in front of them.",
+            "Every scrape, every bruise and every risk had been worth it.",
+        ],
+        "ending": [
+            "They had done it, but only just.",
+            "{hero} laughed, breathless, as the dust finally settled.",
+            "But far away, something else had just woken up.",
+            "The map in {pos} pocket was already redrawing itself.",
+            "The next adventure was already on its way.",
+            "And {hero} could hardly wait.",
+        ],
+        "twist": [
+            "The victory lasted exactly one night.",
+            "At dawn, a signal flare burst red above {place}.",
+            "Someone had stolen {object}.",
+            "Worse, they had left a trail that was far too easy to follow.",
+            "It was a trap, and everybody knew it.",
+        ],
+        "turn_continued": [
+            "They went anyway.",
+            "The chase tore through markets, over rooftops and down into the tunnels.",
+            "Every corner hid another surprise, and not one of them was pleasant.",
+            "Then, in the deepest tunnel of all, the trail simply stopped.",
+            "Something enormous shifted in the dark.",
+        ],
+        "close": [
+            "There was only one way out, and it led straight up.",
+            "Hearts pounding, they started to climb.",
+            "Whatever waited at the top, they would face it together.",
+            "And this time, they would be ready.",
+        ],
+    },
+    "mystery": {
+        "places": [
+            "an old manor at the end of a fog-bound lane", "a seaside town where the tide came in at the wrong hours",
+            "a railway station that had been closed for forty years",
+            "a library whose lights burned all night with no one inside",
+            "a village where every clock had stopped at the same minute", "a lighthouse that had not been lit since the storm",
+        ],
+        "roles": [
+            "a detective who trusted no one, least of all coincidences", "a night-shift archivist with a talent for noticing",
+            "a postman who read the backs of envelopes", "a retired inspector who had never quite retired",
+            "a schoolteacher with a habit of asking awkward questions", "a newspaper reporter chasing one last story",
+        ],
+        "companions": [
+            "a black cat that seemed to understand every word", "an old notebook full of other people's secrets",
+            "a nervous assistant named Pell", "a lantern with a cracked glass",
+            "a neighbour who talked too much and saw too little", "a dog that would not stop growling at the cellar door",
+        ],
+        "objects": [
+            "a letter sealed with grey wax", "a photograph with one face scratched out",
+            "a key that fitted no lock in the house", "a pocket watch stopped at seven minutes past three",
+            "a set of footprints that ended in the middle of the floor", "a page torn from a stranger's diary",
+        ],
+        "hook": [
+            "The first sign that something was wrong in {place} was the silence.",
+            "No one could say exactly when the rumours about {topic} began, only that they were never spoken above a whisper.",
+            "It was the kind of night when the fog presses against the windows, as though it wants to listen.",
+            "Everyone agreed that {topic} was only a story, right up until the evening it stopped being one.",
+            "Some secrets keep themselves, but {topic} had been waiting a very long time for someone to ask the right question.",
+        ],
+        "protagonist": [
+            "{hero} was {role}, and had never once believed in ghosts.",
+            "What {hero} did believe in was evidence, and the evidence was beginning to pile up.",
+            "{hero} arrived just after dusk, with {companion} and far more questions than answers.",
+            "Something about the case had kept {hero} awake for three nights running.",
+            "{hero} noticed the details other people walked straight past, and tonight the details were whispering.",
+        ],
+        "challenge": [
+            "On the table lay {object}, placed there deliberately, as if someone wanted it found.",
+            "Every witness told the same story, word for word, and that was exactly what made it impossible to believe.",
+            "Then the lights went out, and somewhere in the dark, a door that had been locked for years slowly creaked open.",
+            "The more {hero} uncovered about {topic}, the less any of it seemed to make sense.",
+            "Someone, or something, was always one careful step ahead.",
+        ],
+        "turn": [
+            "And then, in the silence, {hero} finally saw it: the one small detail that did not belong.",
+            "Slowly, carefully, the pieces began to fit together, and the picture they made was not a comfortable one.",
+            "{hero} turned {object} over in the lamplight, and there was the answer, hiding in plain sight all along.",
+            "The truth about {topic} was stranger than any rumour, and far closer to home.",
+            "Behind the last door, waiting patiently in the dark, was the one person nobody had thought to suspect.",
+        ],
+        "ending": [
+            "The case was closed, or so everyone said.",
+            "But as {hero} stepped back out into the fog, a quiet voice spoke from the shadows: this is not over.",
+            "And on the doorstep the next morning sat another envelope, sealed with the very same grey wax.",
+            "Some mysteries end, but the best ones only pause, waiting for someone brave enough to keep asking.",
+            "{hero} smiled faintly, because now, at last, the real questions could begin.",
+        ],
+        "twist": [
+            "Three days later, the fog rolled back in, heavier than before.",
+            "With it came {object}, left on the doorstep where anyone might have found it.",
+            "Nobody had seen who delivered it, and nobody would admit to having looked.",
+            "One thing was certain: the first answer had only been the beginning.",
+        ],
+        "turn_continued": [
+            "The trail led back to {place}, and this time the door was already open.",
+            "Inside, everything was exactly as it had been left, except for one chair, turned to face the window.",
+            "Someone had been waiting there, patiently, for a very long time.",
+            "And on the dusty glass, written by a careful finger, was a single name.",
+        ],
+        "close": [
+            "It was a name that should not have been possible.",
+            "Outside, somewhere in the fog, footsteps began to walk slowly away.",
+            "The real mystery, it seemed, had only just begun.",
+            "And whoever was behind it wanted very much to be found.",
+        ],
+    },
+    "comedy": {
+        "places": [
+            "a town so small the welcome sign was also the goodbye sign", "a bakery that was technically also a zoo",
+            "the world's least successful theme park", "a village where the mayor was a goat",
+            "an office building with forty-seven floors and one working lift", "a castle held together mostly by tape",
+        ],
+        "roles": [
+            "a wizard who was allergic to magic", "the world's most overconfident plumber",
+            "a knight who was afraid of horses", "a pirate who got seasick in the bath",
+            "an inventor whose inventions worked about half the time", "a retired superhero with a bad back",
+        ],
+        "companions": [
+            "a sarcastic goose named Gerald", "a hamster with enormous ambitions",
+            "a cousin who always had a plan, and it was always a bad one", "a talking toaster with strong opinions",
+            "a dog who had eaten at least one important document", "a very small and very loud parrot",
+        ],
+        "objects": [
+            "an instruction manual written entirely in riddles", "a rubber chicken of mysterious origin",
+            "a suspiciously enchanted spoon", "a map drawn on the back of a pizza menu",
+            "a wand that only ever produced pigeons", "a trophy for second place in a contest nobody remembered entering",
+        ],
+        "hook": [
+            "This is the story of {topic}, and I want to be clear from the start: none of it was anyone's fault, except for the parts that were.",
+            "It all began in {place}, which, to be fair, is where most ridiculous things begin.",
+            "Nobody planned for {topic}, which is a shame, because a plan would have helped enormously.",
+            "Historians still argue about {topic}, mostly because none of them can tell the story without laughing.",
+            "There are good ideas, there are bad ideas, and then there was {topic}.",
+        ],
+        "protagonist": [
+            "Our hero was {hero}, {role}.",
+            "{hero} had exactly one talent, and unfortunately it was not a useful one.",
+            "Everywhere {hero} went, {companion} followed, offering advice nobody had asked for.",
+            "{hero} believed, with total confidence, that everything would be fine, which was the first mistake.",
+            "To be completely honest, {hero} had not read the instructions, and had no intention of starting now.",
+        ],
+        "challenge": [
+            "Things went wrong almost immediately, and then, impressively, they went wrong in a completely different direction.",
+            "The only tool available was {object}, which was not ideal, but it was very shiny.",
+            "By lunchtime there had been two small fires, one medium-sized flood and a deeply confused delivery man.",
+            "Naturally, {hero} decided the best solution was to make everything much, much bigger.",
+            "Somehow, and nobody is quite sure how, {topic} ended up wearing a hat.",
+        ],
+        "turn": [
+            "And then, against every known law of common sense, the plan actually started to work.",
+            "{hero} waved {object} in the air, shouted the first words that came to mind, and hoped for the best.",
+            "There was a pause. There was a loud pop. There were, inexplicably, pigeons.",
+            "Everyone held their breath, mostly because of the smell.",
+            "For one shining moment, everything went exactly right, which surprised {hero} more than anyone.",
+        ],
+        "ending": [
+            "In the end, everyone agreed it had been a triumph, or at least not a total disaster, which around here counted as a party.",
+            "{hero} took a bow, tripped over {companion}, and decided to call it a day.",
+            "And the lesson, if there was one, was this: always read the instructions, unless they are written in riddles.",
+            "Of course, that was before anyone found out what the goat had been planning all along.",
+            "But that, as they say, is a whole other story, and it is even sillier than this one.",
+        ],
+        "twist": [
+            "Things stayed calm for almost a whole afternoon, which was a new record.",
+            "Then {companion} found {object} in the biscuit tin, and nobody could explain how it got there.",
+            "It was glowing, which was worrying, and humming, which was more worrying still.",
+            "Someone suggested putting it back, but that would have been far too sensible.",
+        ],
+        "turn_continued": [
+            "So naturally, everyone poked it at the same time.",
+            "There was a flash, a bang and a noise like a trombone falling down the stairs.",
+            "When the smoke cleared, the furniture had swapped places and the cat was wearing a tiny crown.",
+            "Nobody was hurt, although several people's dignity would never fully recover.",
+        ],
+        "close": [
+            "It was, by any reasonable measure, a complete disaster, and also the best day in months.",
+            "And somewhere in the distance, a goat was laughing.",
+            "What happened next is still being argued about to this day.",
+            "But that is a story for another time, preferably one with fewer pigeons.",
+        ],
+    },
+}
+
+
+class StoryEngine:
+    """Assembles stories from BANKS, deterministically for a given seed.
+
+    Each beat takes sentences from its bank (in bank order, so they read in
+    sequence) until it has its share of the words still to come, so a long
+    sentence early on leaves less for the beats after it. Templates are
+    compiled once into their bound format_map.
+    """
+
+    def __init__(self, banks=BANKS, heroes=HEROES, story_words=(215, 270), continuation_words=(120, 170)):
+        self.heroes = heroes
+        self.story_words = story_words
+        self.continuation_words = continuation_words
+        self._banks = {}
+        for style, bank in banks.items():
+            compiled = {}
+            for key, entries in bank.items():
+                if key in ("places", "roles", "companions", "objects"):
+                    compiled[key] = entries
+                else:
+                    compiled[key] = [template.format_map for template in entries]
+            self._banks[style] = compiled
+
+    def _bank(self, voice_style):
+        return self._banks.get(voice_style) or self._banks["storyteller"]
+
+    def _slots(self, rng, bank, topic):
+        hero, obj, pos = rng.choice(self.heroes)
+        return {
+            "topic": topic, "hero": hero, "obj": obj, "pos": pos,
+            "place": rng.choice(bank["places"]), "role": rng.choice(bank["roles"]),
+            "companion": rng.choice(bank["companions"]), "object": rng.choice(bank["objects"]),
+        }
+
+    def _beats(self, rng, bank, beats, slots, target):
+        paragraphs = []
+        words = 0
+        shares = sum(share for _, share in beats)
+        for beat, share in beats:
+            wanted = (target - words) * share / shares
+            shares -= share
+            templates = bank[beat]
+            chosen = []
+            beat_words = 0
+            for index in rng.sample(range(len(templates)), len(templates)):
+                if chosen and beat_words >= wanted:
+                    break
+                sentence = templates[index](slots)
+                chosen.append((index, sentence[0].upper() + sentence[1:]))
+                beat_words += len(sentence.split())
+            chosen.sort()
+            paragraphs.append(" ".join(sentence for _, sentence in chosen))
+            words += beat_words
+        return "\n\n".join(paragraphs)
+
+    def story(self, topic, voice_style="storyteller", seed=None):
+        """A five-beat story about ``topic`` (a noun phrase) in the style's voice"""
+        rng = random.Random(seed)
+        bank = self._bank(voice_style)
+        slots = self._slots(rng, bank, topic)
+        return self._beats(rng, bank, BEATS, slots, rng.randint(*self.story_words))
+
+    def continuation(self, voice_style="storyteller", seed=None):
+        """A next part that needs nothing from the previous one: a twist, a turn, an open close"""
+        rng = random.Random(seed)
+        bank = self._bank(voice_style)
+        slots = self._slots(rng, bank, "")
+        return self._beats(rng, bank, CONTINUATION_BEATS, slots, rng.randint(*self.continuation_words))
+
+    def ending(self, voice_style="storyteller", seed=None):
+        """A couple of closing sentences to round off a story that broke off"""
+        rng = random.Random(seed)
+        bank = self._bank(voice_style)
+        return self._beats(rng, bank, (("close", 1),), self._slots(rng, bank, ""), 20)
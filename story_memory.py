@@ -0,0 +1,135 @@
+"""Bounded rolling memory of a session's story for continuation prompts.
+
+After every turn the memory is updated incrementally: one key line per turn
+goes into a running summary, named characters and places are tallied, and the
+closing sentences are kept for voice continuity. ``memory_context`` renders it
+within a fixed token budget, so continuation prompts stay the same size no
+matter how long the session runs.
+"""
+import re
+
+SENTENCE_END = re.compile(r'(?<=[.!?])["”]?\s+')
+NAME = re.compile(r"\b[A-Z][a-z'’]+(?:\s+[A-Z][a-z'’]+)*")
+
+# Capitalised words that aren't names (sentence starts, pronouns, ...)
+NOT_NAMES = {
+    "A", "An", "And", "As", "At", "But", "By", "For", "From", "He", "Her", "His", "How",
+    "I", "If", "In", "It", "Its", "Just", "Long", "Maybe", "Meanwhile", "My", "No", "Not",
+    "Now", "Of", "On", "Once", "One", "Or", "She", "So", "Some", "Still", "Suddenly",
+    "That", "The", "Their", "Then", "There", "These", "They", "This", "Those", "To",
+    "Until", "We", "What", "When", "Where", "While", "Who", "Why", "With", "Yes", "You",
+    "Your", "Without", "After", "Before", "Every", "Each", "All", "Nothing", "Something"
+}
+
+MAX_ENTITIES = 12
+MAX_BEATS = 16
+MAX_LINE_TOKENS = 40
+RECENT_SENTENCES = 3
+
+
+def estimate_tokens(text):
+    """Rough token count (about 4 tokens per 3 words), good enough for budgeting"""
+    return (len(text.split()) * 4 + 2) // 3
+
+
+def truncate_tokens(text, budget):
+    words = text.split()
+    keep = max(0, budget * 3 // 4)
+    if len(words) <= keep:
+        return text
+    return " ".join(words[:keep]) + "..."
+
+
+def split_sentences(text):
+    return [s.strip() for s in SENTENCE_END.split(text.strip()) if s.strip()]
+
+
+def find_names(text, known=()):
+    """Names in the text: capitalised runs, once per mention.
+
+    A lone capitalised word opening a sentence ("Look!", "Behind it...") is
+    only a name if it also turns up capitalised mid-sentence, here or among
+    the ``known`` names from earlier turns.
+    """
+    found = []
+    for match in NAME.finditer(text):
+        words = match.group().split()
+        while words and words[0] in NOT_NAMES:
+            words.pop(0)
+        if not words:
+            continue
+        opens_sentence = match.start() == 0 or text[:match.start()].rstrip()[-1:] in '.!?"“'
+        found.append((" ".join(words), opens_sentence and len(words) == 1))
+    confirmed = set(known) | {name for name, unsure in found if not unsure}
+    return [name for name, unsure in found if not unsure or name in confirmed]
+
+
+def key_line(sentences, entities):
+    """The sentence that carries most of a turn: most named things, then longest"""
+    def score(sentence):
+        return (sum(1 for name in entities if name in sentence), min(len(sentence.split()), 30))
+    return truncate_tokens(max(sentences, key=score), MAX_LINE_TOKENS)
+
+
+def update_memory(memory, story, topic=None):
+    """Fold one more story turn into the memory (returns a new dict).
+
+    ``memory`` is None for a fresh story; pass the previous memory for a
+    continuation.
+    """
+    memory = dict(memory or {"topic": topic, "turns": 0, "opening": None, "beats": [], "entities": {}})
+    sentences = split_sentences(story)
+    if not sentences:
+        return memory
+
+    entities = dict(memory["entities"])
+    for name in find_names(story, entities):
+        entities[name] = entities.get(name, 0) + 1
+    # Keep the most mentioned names, bounded
+    entities = dict(sorted(entities.items(), key=lambda item: -item[1])[:MAX_ENTITIES])
+
+    line = key_line(sentences, entities)
+    memory["turns"] += 1
+    if memory["opening"] is None:
+        memory["opening"] = line
+        memory["beats"] = []
+    else:
+        # Older beats than this never fit a sensible budget anyway
+        memory["beats"] = (memory["beats"] + [line])[-MAX_BEATS:]
+    memory["entities"] = entities
+    memory["recent"] = " ".join(sentences[-RECENT_SENTENCES:])
+    return memory
+
+
+def memory_context(memory, budget=300):
+    """Render the memory as prompt text in at most ``budget`` tokens.
+
+    The closing sentences and the names get fixed shares; the summary keeps
+    the opening line plus as many of the latest beats as fit.
+    """
+    recent = truncate_tokens(memory.get("recent", ""), budget * 2 // 5)
+    names = ", ".join(name for name, weight in memory["entities"].items() if weight >= 1)
+    names = truncate_tokens(names, budget // 6) if names else ""
+
+    remaining = budget - estimate_tokens(recent) - estimate_tokens(names) - 20
+    summary = []
+    if memory.get("opening"):
+        opening = truncate_tokens(memory["opening"], max(0, remaining))
+        summary.append(opening)
+        remaining -= estimate_tokens(opening)
+    latest = []
+    for beat in reversed(memory["beats"]):
+        cost = estimate_tokens(beat)
+        if cost > remaining:
+            break
+        latest.append(beat)
+        remaining -= cost
+    if len(latest) < len(memory["beats"]):
+        summary.append("...")
+    summary.extend(reversed(latest))
+
+    parts = [f"Story so far ({memory['turns']} parts): " + " ".join(summary)]
+    if names:
+        parts.append(f"Characters and places: {names}")
+    parts.append(f"Most recent moment: {recent}")
+    return "\n".join(parts)
@@ -0,0 +1,75 @@
+"""Background pool of pre-generated stories for generic requests"""
+import threading
+import time
+from collections import deque
+
+
+class WarmPool:
+    """Keeps up to ``per_key`` ready stories for each key, refilled in the background.
+
+    ``generate(key)`` produces one story (or None on failure). The refill
+    thread calls it at most ``per_minute`` times a minute, always topping up
+    the emptiest key first, and sleeps while every key is full.
+    """
+
+    def __init__(self, generate, keys, per_key=2, per_minute=6):
+        self.generate = generate
+        self.per_key = per_key
+        self.interval = 60.0 / per_minute
+        self._stories = {key: deque() for key in keys}
+        self._cond = threading.Condition()
+        self._thread = None
+        self.counters = {"hits": 0, "misses": 0, "generated": 0, "failures": 0}
+
+    def start(self):
+        """Start the refill thread (once per process; call lazily so forked workers get their own)"""
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._refill, name="warm-pool", daemon=True)
+                self._thread.start()
+
+    def take(self, *keys):
+        """(key, story) from the first of ``keys`` that has one ready, else None"""
+        with self._cond:
+            for key in keys:
+                stories = self._stories.get(key)
+                if stories:
+                    self.counters["hits"] += 1
+                    self._cond.notify()
+                    return key, stories.popleft()
+            self.counters["misses"] += 1
+            return None
+
+    def _next_key(self):
+        key = min(self._stories, key=lambda k: len(self._stories[k]))
+        return key if len(self._stories[key]) < self.per_key else None
+
+    def _refill(self):
+        while True:
+            with self._cond:
+                key = self._cond.wait_for(self._next_key)
+
+            started = time.monotonic()
+            try:
+                story = self.generate(key)
+            except Exception as e:
+                print(f"Warm pool generation error: {e}")
+                story = None
+
+            with self._cond:
+                if story:
+                    self._stories[key].append(story)
+                    self.counters["generated"] += 1
+                else:
+                    self.counters["failures"] += 1
+
+            # Respect the refill rate so the pool never eats the upstream quota
+            time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def stats(self):
+        with self._cond:
+            return {
+                "ready": sum(len(stories) for stories in self._stories.values()),
+                "capacity": self.per_key * len(self._stories),
+                **self.counters
+            }